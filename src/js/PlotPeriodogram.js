@@ -1,28 +1,59 @@
 import React, { useState, useEffect } from 'react';
 import { useLocation } from 'react-router-dom';
+import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer } from 'recharts';
+
+const MAX_BINS = 512; // Number of frequency bins requested from the server
 
 function PlotPeriodogram() {
+  const [psdData, setPsdData] = useState(null);
   const [imageSrc, setImageSrc] = useState(null);
   const location = useLocation();  // To receive the passed state (samplingRate)
   const samplingRate = location.state?.samplingRate || 1000; // Default sampling rate if not provided
 
   useEffect(() => {
-    // Fetch the PSD plot from the FastAPI server and include the sampling rate
-    fetch(`/periodogram?samplingRate=${samplingRate}`)
-      .then((response) => response.blob())
-      .then((imageBlob) => {
-        const imageObjectURL = URL.createObjectURL(imageBlob);
-        setImageSrc(imageObjectURL);
+    // Fetch the PSD values from the FastAPI server and plot them client-side
+    fetch(`/psd?samplingRate=${samplingRate}&db=true&maxBins=${MAX_BINS}`)
+      .then((response) => response.json())
+      .then((psd) => {
+        if (psd.error) {
+          throw new Error(psd.error);
+        }
+        setPsdData(psd.frequencies.map((frequency, i) => ({ frequency, power: psd.power[i] })));
       })
       .catch((error) => {
-        console.error('Error fetching periodogram:', error);
+        console.error('Error fetching PSD data, falling back to the rendered periodogram:', error);
+        // Fall back to the server-rendered PNG
+        fetch(`/periodogram?samplingRate=${samplingRate}`)
+          .then((response) => response.blob())
+          .then((imageBlob) => {
+            const imageObjectURL = URL.createObjectURL(imageBlob);
+            setImageSrc(imageObjectURL);
+          })
+          .catch((error) => {
+            console.error('Error fetching periodogram:', error);
+          });
       });
   }, [samplingRate]);
 
   return (
     <div>
       <h1>Periodogram</h1>
-      {imageSrc ? (
+      {psdData ? (
+        <div style={{ width: '100%', height: 480 }}>
+          <ResponsiveContainer width="100%" height="100%">
+            <LineChart data={psdData}>
+              <CartesianGrid stroke="#444" strokeDasharray="3 3" />
+              <XAxis dataKey="frequency" type="number" domain={['dataMin', 'dataMax']} stroke="#f0f0f0"
+                     label={{ value: 'Frequency (Hz)', position: 'insideBottom', offset: -5 }} />
+              <YAxis stroke="#f0f0f0"
+                     label={{ value: 'PSD (dB/Hz)', angle: -90, position: 'insideLeft' }} />
+              <Tooltip contentStyle={{ backgroundColor: '#3b3b3b', borderColor: '#555', color: '#f0f0f0' }}
+                       itemStyle={{ color: '#f0f0f0' }} />
+              <Line type="monotone" dataKey="power" stroke="#ff6347" strokeWidth={2} dot={false} isAnimationActive={false} />
+            </LineChart>
+          </ResponsiveContainer>
+        </div>
+      ) : imageSrc ? (
         <img src={imageSrc} alt="Periodogram" style={{ maxWidth: '100%' }} />
       ) : (
         <p>Loading periodogram...</p>
@@ -17,6 +17,7 @@ const SignalPlotter = () => {
   const recordingWorker = useRef(null);
   const statsWorker = useRef(null);
   const [serverPort, setPort] = useState(80);
+  const [streamUrl, setStreamUrl] = useState(null); // Backend fan-out stream (/ws/stream), if configured
   const [isConnected, setIsConnected] = useState(false);
   const [offset, setOffset] = useState(0);
   const [yMin, setYMin] = useState(-1);
@@ -40,6 +41,7 @@ const SignalPlotter = () => {
     mean: 'N/A',
     rms: 'N/A',
   });
+  const [classification, setClassification] = useState(null); // Rolling label announced on /ws/stream
 
   const isLockedRef = useRef(false);
   const subsamplingRef = useRef(1);
@@ -48,6 +50,7 @@ const SignalPlotter = () => {
   const sampleCounter = useRef(0);
   const formulaRef = useRef('x');
   const previousFiltered = useRef(0);
+  const wsRef = useRef(null);
 
   useEffect(() => {
     subsamplingRef.current = subsampling;
@@ -127,6 +130,7 @@ const SignalPlotter = () => {
         setPoints(config.maxPoints);
         setSubsampling(config.subsampling);
         setChannel(config.channel);
+        setStreamUrl(config.streamUrl || null);
         setConfigLoaded(true);
         console.log('Loading config.json parameters!');
       })
@@ -265,9 +269,14 @@ const SignalPlotter = () => {
   useEffect(() => {
     if (configLoaded) {
       let ws;
+      let closed = false;
 
+      // The backend stream decimates server-side and sends batches of samples
       const connectWebSocket = () => {
-        ws = new WebSocket(`ws://localhost:${serverPort}`);
+        ws = new WebSocket(streamUrl
+          ? `${streamUrl}?subsampling=${Math.max(1, subsamplingRef.current)}&maxPoints=${pointsRef.current}`
+          : `ws://localhost:${serverPort}`);
+        wsRef.current = ws;
 
         ws.onopen = () => {
           setIsConnected(true);
@@ -276,65 +285,85 @@ const SignalPlotter = () => {
         ws.onmessage = (event) => {
           if (!isLockedRef.current) {
             try {
-              let { n, signal } = JSON.parse(event.data);
-
-              // Initialize previousFiltered on the first signal
-              if (previousFiltered.current === 0) {
-                previousFiltered.current = signal;
+              const message = JSON.parse(event.data);
+              if (message.classification) {
+                setClassification(message.classification);
+                return;
               }
+              const samples = Array.isArray(message.n) ? message.n : [message.n];
+              const signals = Array.isArray(message.signal) ? message.signal : [message.signal];
+              samples.forEach((n, i) => handleSample(n, signals[i]));
+            } catch (error) {
+              console.error('Error parsing WebSocket message:', error);
+            }
+          }
+        };
 
-              // Apply offset
-              signal = signal + offsetRef.current;
+        ws.onclose = () => {
+          setIsConnected(false);
+          if (!closed) {
+            setTimeout(connectWebSocket, 5000);
+          }
+        };
+      };
 
-              // Apply leaky integrator only if filtering is enabled
-              if (filteringEnabledRef.current) {
-                signal = alphaRef.current * signal + (1 - alphaRef.current) * previousFiltered.current;
-              }
+      const handleSample = (n, signal) => {
+        // Initialize previousFiltered on the first signal
+        if (previousFiltered.current === 0) {
+          previousFiltered.current = signal;
+        }
 
-              previousFiltered.current = signal;
+        // Apply offset
+        signal = signal + offsetRef.current;
 
-              const calculatedSignal = applyFormula(previousFiltered.current);
+        // Apply leaky integrator only if filtering is enabled
+        if (filteringEnabledRef.current) {
+          signal = alphaRef.current * signal + (1 - alphaRef.current) * previousFiltered.current;
+        }
 
-              sampleCounter.current++;
+        previousFiltered.current = signal;
 
-              if (chartRef.current && chartRef.current.data && sampleCounter.current >= Math.max(1, subsamplingRef.current)) {
-                if (chartRef.current.data.labels.length >= pointsRef.current) {
-                  removeData(chartRef.current);
-                }
+        const calculatedSignal = applyFormula(previousFiltered.current);
 
-                addData(chartRef.current, n, calculatedSignal);
+        sampleCounter.current++;
 
-                if (isRecording) {
-                  setRecordedData((prevData) => [...prevData, { sample: n, voltage: calculatedSignal }]);
-                }
+        const clientSubsampling = streamUrl ? 1 : Math.max(1, subsamplingRef.current);
+        if (chartRef.current && chartRef.current.data && sampleCounter.current >= clientSubsampling) {
+          if (chartRef.current.data.labels.length >= pointsRef.current) {
+            removeData(chartRef.current);
+          }
 
-                statsWorker.current.postMessage({
-                  action: 'process',
-                  n: n,
-                  signal: calculatedSignal,
-                });
+          addData(chartRef.current, n, calculatedSignal);
 
-                sampleCounter.current = 0;
-              }
-            } catch (error) {
-              console.error('Error parsing WebSocket message:', error);
-            }
+          if (isRecording) {
+            setRecordedData((prevData) => [...prevData, { sample: n, voltage: calculatedSignal }]);
           }
-        };
 
-        ws.onclose = () => {
-          setIsConnected(false);
-          setTimeout(connectWebSocket, 5000);
-        };
+          statsWorker.current.postMessage({
+            action: 'process',
+            n: n,
+            signal: calculatedSignal,
+          });
+
+          sampleCounter.current = 0;
+        }
       };
 
       connectWebSocket();
 
       return () => {
+        closed = true;
         ws.close();
       };
     }
-  }, [configLoaded]);
+  }, [configLoaded, streamUrl]);
+
+  // Tell the backend stream about decimation changes
+  useEffect(() => {
+    if (streamUrl && wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
+      wsRef.current.send(JSON.stringify({ subsampling: Math.max(1, subsampling), maxPoints: points }));
+    }
+  }, [streamUrl, subsampling, points]);
 
   const handleChannelChange = async (event) => {
       const selectedChannel = parseInt(event.target.value, 10);
@@ -628,6 +657,9 @@ const SignalPlotter = () => {
           <p>Min: {stats.min}</p>
           <p>Mean: {stats.mean}</p>
           <p>RMS: {stats.rms}</p>
+          {classification && (
+            <p>Class: {classification.label} ({(classification.confidence * 100).toFixed(0)}%)</p>
+          )}
         </div>
       </Col>
     </Container>
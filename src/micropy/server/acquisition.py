@@ -0,0 +1,158 @@
+import rp2
+import machine
+import uasyncio as asyncio
+from array import array
+from time import ticks_us, ticks_diff
+
+# RP2040 ADC registers (datasheet section 4.9.6)
+ADC_BASE = 0x4004c000
+ADC_CS = ADC_BASE + 0x00
+ADC_FCS = ADC_BASE + 0x08
+ADC_FIFO = ADC_BASE + 0x0c
+ADC_DIV = ADC_BASE + 0x10
+
+ADC_CS_EN = 1 << 0
+ADC_CS_TS_EN = 1 << 1
+ADC_CS_START_MANY = 1 << 3
+ADC_TEMPERATURE_INPUT = 4
+ADC_FCS_EN = 1 << 0
+ADC_FCS_DREQ_EN = 1 << 3
+ADC_FCS_THRESH_1 = 1 << 24
+
+ADC_CLOCK = 48000000  # The ADC runs from the 48MHz USB PLL
+DREQ_ADC = 36
+
+
+class BlockAcquisition:
+    """Hardware-timed ADC acquisition of one or more inputs into a pair of preallocated blocks.
+
+    The ADC free-runs at ``rate`` samples per second per input (paced by its
+    clock divider), cycling round-robin through ``adc_inputs`` (0-2 for
+    GP26-GP28, 4 for the temperature sensor), and two chained DMA channels copy
+    its FIFO alternately into two ``array('H')`` blocks of ``block_size``
+    samples per input, interleaved in input order. Sampling therefore never
+    depends on the asyncio scheduler.
+
+    The DMA completion interrupt re-arms the finished channel and numbers the
+    full block. Every connection reads the stream through its own
+    ``reader()``, which keeps the sequence number it has seen last, so all
+    connections get every block they keep up with. A block is overwritten
+    once the block after it completes; blocks a reader skips or could not
+    copy in time are counted in ``dropped_blocks``, in total and per reader.
+    """
+
+    def __init__(self, adc_inputs, rate, block_size):
+        self.rate = rate
+        self.block_size = block_size
+        self.adc_inputs = sorted(adc_inputs)  # The round-robin visits inputs in ascending order
+        self.block_length = block_size * len(self.adc_inputs)
+        self.blocks = (array('H', [0] * self.block_length), array('H', [0] * self.block_length))
+        self.completed_blocks = 0  # Blocks filled by DMA; block n lives in blocks[n % 2]
+        self.dropped_blocks = 0  # Blocks missed by readers, summed over all readers
+        self.actual_rate = 0.0  # Measured from the time between block completions
+        self._ticks = 0  # Completion time of the most recent block
+        self._prev_ticks = 0
+        self._flag = asyncio.ThreadSafeFlag()  # Set by the interrupt; only the dispatcher waits on it
+        self._event = asyncio.Event()  # Wakes every waiting reader
+        self._channels = (rp2.DMA(), rp2.DMA())
+
+    def start(self):
+        asyncio.create_task(self._dispatch())
+        first, second = self._channels
+        for index, (channel, other) in enumerate(((first, second), (second, first))):
+            ctrl = channel.pack_ctrl(size=1, inc_read=False, inc_write=True, treq_sel=DREQ_ADC,
+                                     chain_to=other.channel, irq_quiet=False)
+            channel.config(read=ADC_FIFO, write=self.blocks[index], count=self.block_length, ctrl=ctrl)
+            channel.irq(handler=self._block_done, hard=True)
+
+        # 12-bit samples into a FIFO that raises DREQ as soon as it holds one sample
+        machine.mem32[ADC_FCS] = ADC_FCS_EN | ADC_FCS_DREQ_EN | ADC_FCS_THRESH_1
+        machine.mem32[ADC_DIV] = (ADC_CLOCK // (self.rate * len(self.adc_inputs)) - 1) << 8
+        first.active(1)
+
+        cs = ADC_CS_EN | ADC_CS_START_MANY | (self.adc_inputs[0] << 12)
+        if len(self.adc_inputs) > 1:
+            mask = 0
+            for adc_input in self.adc_inputs:
+                mask |= 1 << adc_input
+            cs |= mask << 16  # RROBIN
+        if ADC_TEMPERATURE_INPUT in self.adc_inputs:
+            cs |= ADC_CS_TS_EN
+        machine.mem32[ADC_CS] = cs
+
+    def stop(self):
+        machine.mem32[ADC_CS] = ADC_CS_EN
+        for channel in self._channels:
+            channel.irq(handler=None)
+            channel.active(0)
+        machine.mem32[ADC_FCS] = 0
+
+    def _block_done(self, channel):
+        # Hard IRQ: no allocation allowed, only small-int bookkeeping
+        index = 0 if channel is self._channels[0] else 1
+        # Re-arm this channel for when the other one chains back to it
+        channel.write = self.blocks[index]
+        channel.count = self.block_length
+        self.completed_blocks += 1
+        self._prev_ticks = self._ticks
+        self._ticks = ticks_us()
+        self._flag.set()
+
+    async def _dispatch(self):
+        # A ThreadSafeFlag has a single waiter, so relay each completion to all readers through an Event
+        while True:
+            await self._flag.wait()
+            if self._prev_ticks:
+                elapsed = ticks_diff(self._ticks, self._prev_ticks)
+                if elapsed > 0:
+                    self.actual_rate = self.block_size * 1000000 / elapsed
+            self._event.set()
+            self._event.clear()
+
+    def reader(self):
+        """A new consumer of the blocks completed from now on, e.g. one per WebSocket connection."""
+        return BlockReader(self)
+
+    def stats(self):
+        return {
+            'rate': self.rate,
+            'actual_rate': self.actual_rate,
+            'completed_blocks': self.completed_blocks,
+            'dropped_blocks': self.dropped_blocks,
+        }
+
+
+class BlockReader:
+    """One consumer's position in the block stream of a BlockAcquisition."""
+
+    def __init__(self, acquisition):
+        self.acquisition = acquisition
+        self.dropped_blocks = 0
+        self._next = acquisition.completed_blocks  # Sequence number of the next block to read
+        self._sequence = -1  # Sequence number of the block being read
+
+    async def next_block(self):
+        """Wait for the newest full block; returns (interleaved block, per-input index of its first sample).
+
+        Copy or send the block, then call release() to learn whether the copy
+        is intact.
+        """
+        acquisition = self.acquisition
+        while acquisition.completed_blocks <= self._next:
+            await acquisition._event.wait()
+        sequence = acquisition.completed_blocks - 1
+        self._drop(sequence - self._next)  # Completed while this reader was busy
+        self._sequence = sequence
+        self._next = sequence + 1
+        return acquisition.blocks[sequence % 2], sequence * acquisition.block_size
+
+    def release(self):
+        """True if the block returned by next_block() was not overwritten while it was being used."""
+        if self.acquisition.completed_blocks - self._sequence <= 1:
+            return True
+        self._drop(1)
+        return False
+
+    def _drop(self, count):
+        self.dropped_blocks += count
+        self.acquisition.dropped_blocks += count
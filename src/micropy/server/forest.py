@@ -0,0 +1,67 @@
+import struct
+from array import array
+
+FOREST_MAGIC = b'WSRF'
+FOREST_VERSION = 1
+FOREST_HEADER = '<4sHHIIHH'  # Magic, version, trees, nodes, leaves, features, classes
+
+
+def _read_array(file, typecode, count):
+    # Preallocate and fill in place; array(typecode, bytes) would make one item per byte on MicroPython
+    values = array(typecode, [0] * count)
+    file.readinto(values)
+    return values
+
+
+class Forest:
+    """Random forest exported by src/py/forest_export.py, evaluated one feature vector at a time.
+
+    Every node of every tree lives in flat arrays: the feature index (-1 for
+    a leaf), the float32 threshold, and the left and right children, where a
+    leaf's left entry is its row of class probabilities. Inference walks each
+    tree from its root and averages the leaf probabilities, like sklearn's
+    ``predict_proba``, without allocating per node.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            header = file.read(struct.calcsize(FOREST_HEADER))
+            magic, version, trees, nodes, leaves, features, classes = struct.unpack(FOREST_HEADER, header)
+            if magic != FOREST_MAGIC or version != FOREST_VERSION:
+                raise ValueError('Not a version %d forest file' % FOREST_VERSION)
+            self.n_features = features
+            self.n_classes = classes
+            self.roots = _read_array(file, 'I', trees)
+            self.feature = _read_array(file, 'h', nodes)
+            self.threshold = _read_array(file, 'f', nodes)
+            self.left = _read_array(file, 'I', nodes)
+            self.right = _read_array(file, 'I', nodes)
+            self.values = _read_array(file, 'f', leaves * classes)
+            self.classes = []
+            for _ in range(classes):
+                length = file.read(1)[0]
+                self.classes.append(file.read(length).decode())
+
+    def predict_proba(self, x):
+        feature = self.feature
+        threshold = self.threshold
+        left = self.left
+        right = self.right
+        totals = [0.0] * self.n_classes
+        for node in self.roots:
+            while feature[node] >= 0:
+                node = left[node] if x[feature[node]] <= threshold[node] else right[node]
+            base = left[node] * self.n_classes
+            for c in range(self.n_classes):
+                totals[c] += self.values[base + c]
+        trees = len(self.roots)
+        return [total / trees for total in totals]
+
+    # Index of the most probable class; self.classes holds the names
+    def predict(self, x):
+        probabilities = self.predict_proba(x)
+        best = 0
+        for c in range(1, self.n_classes):
+            if probabilities[c] > probabilities[best]:
+                best = c
+        return best
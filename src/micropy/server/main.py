@@ -4,10 +4,15 @@ import uasyncio as asyncio
 from machine import ADC, Pin, I2C
 import ssd1306
 import json
+import struct
+import uctypes
+from array import array
 from time import sleep
+from acquisition import BlockAcquisition
 
 # Initialize the ADC and OLED
-adc = ADC(Pin(26))  # Use a single ADC pin for voltage reading
+# Configure GP26-GP28 as analog inputs sampled by the acquisition engine
+adc_pins = [ADC(Pin(pin)) for pin in (26, 27, 28)]
 i2c = I2C(0, scl=Pin(5), sda=Pin(4))
 oled = ssd1306.SSD1306_I2C(128, 32, i2c)  # Initialize OLED display
 
@@ -21,45 +26,102 @@ ADC_BITS = 12
 ADC_MAX = (1 << ADC_BITS) - 1
 VOLTAGE_DIVIDER_RATIO = 5.06
 OFFSET = -0.07
-SAMPLING_RATE = 44000  # Hz for WebSocket transmission
+SAMPLING_RATE = 44000  # Hz per input, paced by the ADC clock divider
 OLED_UPDATE_INTERVAL = 0.1  # 100ms for OLED update
+BATCH_SIZE = 256  # Samples per acquisition block and binary WebSocket frame
+
+# Binary frame layout (little-endian): version, channel count, samples per channel,
+# starting sample index and sampling rate, then a (scale, offset) float32 pair per
+# channel so that voltage = code * scale + offset, then the uint16 ADC codes.
+FRAME_VERSION = 1
+FRAME_HEADER = '<BBHIf'
+FRAME_CALIBRATION = '<ff'
+VOLTAGE_SCALE = V_REF / ADC_MAX * VOLTAGE_DIVIDER_RATIO
+
+# Sampled ADC inputs (0-2 = GP26-GP28, 4 = temperature sensor) and the (scale, offset)
+# that converts each one's codes: GP26 sits behind the voltage divider, GP27/GP28 are
+# read directly, and the temperature sensor is converted to degrees Celsius.
+ADC_INPUTS = (0, 1, 2, 4)
+ADC_CALIBRATION = {
+    0: (VOLTAGE_SCALE, OFFSET),
+    1: (V_REF / ADC_MAX, 0.0),
+    2: (V_REF / ADC_MAX, 0.0),
+    4: (-V_REF / ADC_MAX / 0.001721, 27 + 0.706 / 0.001721),
+}
 
 app = Microdot()
+acquisition = BlockAcquisition(ADC_INPUTS, SAMPLING_RATE, BATCH_SIZE)  # The ADC is owned by DMA from now on
+CHANNELS = len(acquisition.adc_inputs)
 
-async def read_adc(n):
-    """Read and convert the ADC value to a voltage, returning sample number and voltage."""
-    raw_value = adc.read_u16()  # Read raw ADC value
-    scaled_value = raw_value >> 4  # Scale down the 16-bit value to 12 bits
-    voltage = scaled_value * V_REF / ADC_MAX  # Convert to voltage
-    actual_voltage = voltage * VOLTAGE_DIVIDER_RATIO + OFFSET  # Adjust for voltage divider
-    return n, actual_voltage
+def to_voltage(code):
+    """Convert a 12-bit ADC code to the input voltage."""
+    return code * VOLTAGE_SCALE + OFFSET  # Adjust for voltage divider
 
 async def oled_task():
-    """Update the OLED with the voltage every 100ms."""
-    n = 0  # Initialize the sample counter
+    """Update the OLED with a recent voltage and the acquisition counters every 100ms."""
     while True:
-        n, voltage = await read_adc(n)  # Read sample number and voltage
-        voltage_str = "{:.2f}V".format(voltage)  # Convert voltage to string with 2 decimal places
+        voltage_str = "{:.2f}V".format(to_voltage(acquisition.blocks[0][0]))  # First channel of a recent block
         oled.fill(0)  # Clear the display
-        oled.text(f'Sample Num: {n}', 0, 0)  # Display sample number
+        oled.text(f'Sample Num: {acquisition.completed_blocks * BATCH_SIZE}', 0, 0)  # Display sample number
         oled.text(f'Voltage: {voltage_str}', 0, 10)  # Display the voltage value as a string
+        oled.text('Rate: {:.0f}Hz'.format(acquisition.actual_rate), 0, 20)
         oled.show()  # Refresh the display
         await asyncio.sleep(OLED_UPDATE_INTERVAL)
-        n += 1  # Increment the sample counter
+
+async def send_json(ws):
+    """Send one JSON object per sample of the first channel; too slow for the full rate, so expect dropped blocks."""
+    reader = acquisition.reader()
+    while True:
+        block, n = await reader.next_block()
+        codes = array('H', block)  # Copy before the DMA writes this block again
+        if not reader.release():
+            continue  # Overwritten while copying
+        for i in range(0, len(codes), CHANNELS):
+            data = json.dumps({'n': n, 'signal': to_voltage(codes[i])})  # Send both n and voltage
+            await ws.send(data)
+            n += 1  # Increment the sample counter
+
+async def send_binary(ws):
+    """Send each acquired block of BATCH_SIZE raw 12-bit ADC codes per channel as one binary frame."""
+    calibration_size = struct.calcsize(FRAME_CALIBRATION)
+    header_size = struct.calcsize(FRAME_HEADER) + CHANNELS * calibration_size
+    header_words = header_size // 2
+    # The whole frame is one preallocated uint16 array; the interleaved samples follow the header
+    frame = array('H', [0] * (header_words + CHANNELS * BATCH_SIZE))
+    frame_bytes = uctypes.bytearray_at(uctypes.addressof(frame), len(frame) * 2)  # Byte view, no copy
+    for i, adc_input in enumerate(acquisition.adc_inputs):
+        scale, offset = ADC_CALIBRATION[adc_input]
+        struct.pack_into(FRAME_CALIBRATION, frame, struct.calcsize(FRAME_HEADER) + i * calibration_size, scale, offset)
+    reader = acquisition.reader()
+    while True:
+        block, n = await reader.next_block()
+        frame[header_words:] = block
+        if not reader.release():
+            continue  # Overwritten while copying
+        struct.pack_into(FRAME_HEADER, frame, 0, FRAME_VERSION, CHANNELS, BATCH_SIZE, n, acquisition.actual_rate or SAMPLING_RATE)
+        await ws.send(frame_bytes)
+
+@app.route('/stats')
+async def stats(request):
+    """Report the configured and measured sampling rate and the block counters."""
+    return acquisition.stats()
 
 @app.route('/ws')
 @with_websocket
 async def websocket(request, ws):
-    """Handle WebSocket communication."""
-    n = 0  # Initialize the sample counter
-    while True:
-        n, voltage = await read_adc(n)  # Read sample number and voltage
-        data = json.dumps({'n': n, 'signal': voltage})  # Send both n and voltage
-        await ws.send(data)
-        await asyncio.sleep(1 / SAMPLING_RATE)
-        n += 1  # Increment the sample counter
+    """Handle WebSocket communication; connect to /ws?format=binary for batched binary frames.
+
+    Each connection reads every acquired block through its own reader, so several clients can stream at once.
+    """
+    if request.args.get('format') == 'binary':
+        await send_binary(ws)
+    else:
+        await send_json(ws)
 
 async def main():
+    # Start sampling into the DMA blocks
+    acquisition.start()
+
     # Start the OLED display task
     asyncio.create_task(oled_task())
     
@@ -1,16 +1,29 @@
 import asyncio
-from fastapi import FastAPI, Response, HTTPException
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import FastAPI, Request, Response, HTTPException, WebSocket
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
+import csv
+import io
 import json
+from itertools import repeat
 import numpy as np
 import logging
-import websockets
-from periodogram import estimate_psd
-from collections import deque
+from periodogram import welch_psd, render_psd, estimate_psd, decimate_bins, to_db, pack_psd, StreamingWelch, NFFT
+from ring_buffer import RingBuffer
+from ingest import Ingestor
+from fanout import Broadcaster, pack_samples
+from lod import MinMaxPyramid, raw_envelope
+from render_cache import RenderCache, make_etag, etag_matches
+from capture_store import CaptureStore, query_captures
+from period_detection import estimate_period, PERIOD_METHODS
 from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
 import time  # Import to use time-based checks
-import requests
+from control_client import ControlClient, LatestValueSender
 
 # Define a Pydantic model for the request body
 class Channel(BaseModel):
@@ -23,6 +36,10 @@ class FuncGenSettings(BaseModel):
     noise: float
     bias: float
 
+# Label applied to the captures recorded from now on; None records unlabelled data
+class CaptureLabel(BaseModel):
+    label: Optional[str] = None
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -40,7 +57,16 @@ config_path = build_path / "config.json"  # Path to the config.json file
 
 # Global variables for config
 config = {}
-data_queue = deque()  # Queue to store WebSocket messages
+render_pool = None  # Worker processes for PSD computation and plot rendering
+render_pending = 0  # Jobs running or queued in the render pool
+stream_rate = None  # Sampling rate reported by a binary stream, if any
+ingestor = None  # Supervised WebSocket consumer
+node_client = None  # Pooled HTTP client for the Node.js control endpoints
+func_gen_sender = None  # Coalesces rapid function generator updates
+channel_sender = None  # Coalesces rapid channel switches
+capture_store = None  # On-disk spool of the ingested samples
+capture_flusher = None  # Task persisting the open capture segments periodically
+classifier = None  # Online classification of the live stream
 
 # Load configuration from config.json
 def load_config():
@@ -72,29 +98,173 @@ app = FastAPI()
 # Load configuration on startup
 @app.on_event("startup")
 async def startup_event():
+    global render_pool, ingestor, node_client, func_gen_sender, channel_sender, capture_store, capture_flusher
+    global classifier
     load_config()
-    asyncio.create_task(websocket_consumer())  # Run the WebSocket consumer in the background
+    node_client = ControlClient(config.get("nodeServer", NODE_SERVER_URL), timeout=NODE_TIMEOUT, retries=NODE_RETRIES)
+    func_gen_sender = LatestValueSender(lambda payload: node_client.post("/update-func-gen", payload))
+    channel_sender = LatestValueSender(lambda payload: node_client.post("/set-channel", payload))
+    # Spawn (rather than fork) the workers so they do not inherit the event loop and sockets
+    render_pool = ProcessPoolExecutor(max_workers=config.get("renderWorkers", RENDER_WORKERS),
+                                      mp_context=multiprocessing.get_context("spawn"))
+    if config.get("capture", True):
+        capture_store = CaptureStore(
+            config.get("captureDir", CAPTURE_DIR),
+            segment_samples=config.get("captureSegmentSamples", CAPTURE_SEGMENT_SAMPLES),
+            max_bytes=config.get("captureMaxBytes", CAPTURE_MAX_BYTES),
+            max_age=config.get("captureMaxAge", CAPTURE_MAX_AGE),
+        )
+        capture_flusher = asyncio.create_task(flush_captures())
+    if config.get("classifier", True):
+        classifier = start_classifier()
+    # Run the WebSocket consumer in the background, reconnecting whenever the source goes away.
+    # "source" may point straight at the Pico, e.g. ws://<pico-ip>/ws?format=binary
+    uri = config.get("source") or f"ws://{config['server']['host']}:{config['server']['port']}"
+    ingestor = Ingestor(uri, ingest_block, queue_size=config.get("ingestQueueSize", INGEST_QUEUE_SIZE))
+    ingestor.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if ingestor is not None:
+        await ingestor.stop()
+    if classifier is not None:
+        await classifier.stop()
+    if capture_flusher is not None:
+        capture_flusher.cancel()
+    if capture_store is not None:
+        capture_store.close()
+    if render_pool is not None:
+        render_pool.shutdown(cancel_futures=True)
+    if node_client is not None:
+        await node_client.close()
 
 # Test API
 @app.get("/test")
 async def test_route():
     return {"message": "Test route works!"}
 
+# Ingestion health: connection state, sequence gaps, lag and queue depth
+@app.get("/ingest/stats")
+async def ingest_stats():
+    if ingestor is None:
+        raise HTTPException(status_code=503, detail="Ingestion not started")
+    return {**ingestor.stats(), "subscribers": broadcaster.stats()}
+
+# Load the model once and start classifying the configured channel; None if the model cannot be loaded.
+# Imported here because the classifier needs scikit-learn and scipy, which the backend does not
+def start_classifier():
+    channel = config.get("classifierChannel", 0)
+    try:
+        from classifier_service import StreamClassifier
+        stream_classifier = StreamClassifier(
+            config.get("classifierModel", CLASSIFIER_MODEL),
+            data_buffers[channel],
+            config.get("classifierPeriodLength"),  # Defaults to the period length saved with the model
+            batch_periods=config.get("classifierBatchPeriods", CLASSIFIER_BATCH_PERIODS),
+            window_periods=config.get("classifierWindowPeriods", CLASSIFIER_WINDOW_PERIODS),
+            on_result=lambda result: broadcaster.announce({"classification": {**result, "channel": channel}}),
+            default_period_length=CLASSIFIER_PERIOD_LENGTH,
+            detect_period=config.get("classifierDetectPeriod", CLASSIFIER_DETECT_PERIOD),
+        )
+    except Exception as e:
+        logger.error(f"Failed to load classifier model: {e}")
+        return None
+    stream_classifier.start()
+    return stream_classifier
+
+# Rolling label of the live stream with its confidence, and per-batch latency metrics
+@app.get("/classifier")
+async def get_classification():
+    if classifier is None:
+        raise HTTPException(status_code=503, detail="Classifier is not running")
+    return {"classification": classifier.result, "stats": classifier.stats()}
+
+# Persist the rows and sidecars of the open capture segments so a crash loses at most one interval
+async def flush_captures():
+    while True:
+        await asyncio.sleep(CAPTURE_FLUSH_INTERVAL)
+        # Only the metadata is copied here; the writer thread does the disk I/O, which can take long on an SD card
+        await asyncio.wrap_future(capture_store.flush())
+
+# Stored capture segments and spooling statistics
+@app.get("/captures")
+async def get_captures():
+    if capture_store is None:
+        raise HTTPException(status_code=503, detail="Capture is disabled")
+    return {**capture_store.stats(), "items": capture_store.index.segments()}
+
+# Stream the stored samples of a channel between two times (ISO 8601 or Unix seconds) and/or sample numbers.
+# CSV has the sample,voltage,label columns of the training data; binary is a sequence of fanout.pack_samples blocks.
+@app.get("/captures/query")
+async def query_captures_range(channel: int = 0, start: datetime = None, end: datetime = None, startN: int = None,
+                               endN: int = None, format: str = "csv"):
+    if capture_store is None:
+        raise HTTPException(status_code=503, detail="Capture is disabled")
+    check_channel(channel)
+    if format not in ("csv", "binary"):
+        raise HTTPException(status_code=400, detail="format must be 'csv' or 'binary'")
+    start_time = start.timestamp() if start else None  # Naive times are local time
+    end_time = end.timestamp() if end else None
+    if start_time is not None and end_time is not None and end_time < start_time:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    # Resolve the overlapping segments now; the rows are read lazily, in a worker thread, as the client consumes them
+    chunks = query_captures(capture_store.index, channel, start_time, end_time, startN, endN)
+
+    if format == "binary":
+        body = (pack_samples(n, signal) for meta, n, signal in chunks)
+        return StreamingResponse(body, media_type="application/octet-stream")
+    return StreamingResponse(csv_rows(chunks), media_type="text/csv",
+                             headers={"Content-Disposition": f'attachment; filename="capture_ch{channel}.csv"'})
+
+# CSV lines for capture chunks, header first; the csv module quotes labels containing commas, quotes or newlines
+def csv_rows(chunks):
+    yield "sample,voltage,label\n"
+    for meta, n, signal in chunks:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerows(zip(n.tolist(), (f"{value:.7g}" for value in signal.tolist()), repeat(meta["label"] or "")))
+        yield buffer.getvalue()
+
+# Label the samples recorded from now on, e.g. {"label": "sine"} while the generator outputs a sine
+@app.post("/captures/label")
+async def set_capture_label(capture_label: CaptureLabel):
+    if capture_store is None:
+        raise HTTPException(status_code=503, detail="Capture is disabled")
+    capture_store.set_label(capture_label.label)
+    return {"status": "success", "label": capture_label.label}
+
+# Live stream of the ingested samples for any number of browsers, so the source serves one connection.
+# Sends {"n": [...], "signal": [...]} batches (or binary with format=binary, see fanout.pack_samples);
+# the client may send {"subsampling": ..., "maxPoints": ...} to change its decimation.
+@app.websocket("/ws/stream")
+async def stream(websocket: WebSocket, channel: int = 0, subsampling: int = None, maxPoints: int = None,
+                 format: str = "json"):
+    if channel < 0 or channel >= MAX_CHANNELS or format not in ("json", "binary"):
+        await websocket.close(code=1008)  # Policy violation
+        return
+    await websocket.accept()
+    await broadcaster.serve(
+        websocket,
+        channel,
+        subsampling if subsampling else config.get("subsampling", 1),
+        maxPoints if maxPoints else config.get("maxPoints", 100),
+        format == "binary",
+    )
+
 # Update function generator settings
 @app.post("/func-gen-ctl")
 async def update_func_gen_settings(settings: FuncGenSettings):
     try:
-        # Send request to Node.js to update the function generator settings
-        node_server_url = "http://localhost/update-func-gen"
+        # Send request to Node.js to update the function generator settings;
+        # rapid slider updates are coalesced so only the latest settings are sent
         payload = {
             "frequency": settings.frequency,
             "samplingRate": settings.samplingRate,
             "noise": settings.noise,
             "bias": settings.bias
         }
-        node_response = requests.post(node_server_url, json=payload)
-        node_response.raise_for_status()  # Raise an error for bad status codes
-        logger.info(f"Node.js response: {node_response.json()}")
+        node_response = await func_gen_sender.submit(payload)
+        logger.info(f"Node.js response: {node_response}")
         return {"status": "success", "settings": settings}
     except Exception as e:
         logger.error(f"Failed to update Func Gen settings on Node.js: {e}")
@@ -109,47 +279,216 @@ async def set_channel(channel_data: Channel):
 
     # Send request to Node.js to update the channel
     try:
-        node_server_url = "http://localhost/set-channel"
         payload = {"channel": channel_data.channel}
-        node_response = requests.post(node_server_url, json=payload)
-        node_response.raise_for_status()  # Raise an error for bad status codes
-        logger.info(f"Node.js response: {node_response.json()}")
+        node_response = await channel_sender.submit(payload)
+        logger.info(f"Node.js response: {node_response}")
         return {"status": "success", "channel": channel_data.channel}
     except Exception as e:
         logger.error(f"Failed to switch channel on Node.js: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to switch channel on Node.js: {e}")
 
-# Serve Spectrum plot with an optional sampling rate
-@app.get("/periodogram")
-async def plot_periodogram(samplingRate: int = None):
+# Sampling rate reported by the binary stream, falling back to the configured one
+def default_sampling_rate():
+    return stream_rate if stream_rate else config["samplingRate"]
+
+# Resolve the requested analysis window to a number of samples
+def window_length(samples, seconds, sampling_rate):
+    if samples is not None and seconds is not None:
+        raise HTTPException(status_code=400, detail="Specify either samples or seconds, not both")
+    if samples is not None:
+        if samples <= 0:
+            raise HTTPException(status_code=400, detail="samples must be positive")
+        return samples
+    if seconds is not None:
+        if seconds <= 0:
+            raise HTTPException(status_code=400, detail="seconds must be positive")
+        return max(1, int(seconds * sampling_rate))
+    return None  # Whole buffer
+
+# Run a CPU-heavy function in the render pool so the event loop (and ingestion) keeps running
+async def run_in_render_pool(func, *args):
+    global render_pending
+    if render_pending >= config.get("renderQueueSize", RENDER_QUEUE_SIZE):
+        raise HTTPException(status_code=503, detail="Too many PSD requests in progress, try again later")
+    render_pending += 1
     try:
-        logger.info("/periodogram endpoint called.")
+        return await asyncio.get_running_loop().run_in_executor(render_pool, func, *args)
+    finally:
+        render_pending -= 1
+
+# Validate an analysis channel index
+def check_channel(channel):
+    if channel < 0 or channel >= MAX_CHANNELS:
+        raise HTTPException(status_code=400, detail="Invalid channel")
+
+# Snapshot of the most recent samples, copied so the workers never see later writes
+def snapshot_signal(count, channel):
+    time_data, signal_data = data_buffers[channel].latest(count)
+    return signal_data.copy()
+
+# Version of the data a PSD request would be computed from; read it right before the data itself
+def data_version(count, channel):
+    if count is None and psd_engines[channel].segments > 0:
+        return ("stream", channel, psd_engines[channel].generation)
+    return ("buffer", channel, data_buffers[channel].generation)
 
-        # Extract data from the queue for processing
-        time_data = []
-        signal_data = []
-        while len(data_queue) > 0:
-            data_point = data_queue.popleft()
-            time_data.append(data_point["n"])
-            signal_data.append(data_point["signal"])
+# Cached response for a request key, honouring If-None-Match; None when it must be computed
+def cached_response(request, key):
+    etag = make_etag(key)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    entry = render_cache.get(key)
+    if entry is None:
+        return None
+    content, media_type = entry
+    return Response(content=content, media_type=media_type, headers={"ETag": etag})
 
-        if len(signal_data) == 0:
-            return {"error": "No data available"}
+# Store a freshly computed response body in the cache and send it with its ETag
+def cache_response(key, content, media_type):
+    render_cache.put(key, content, media_type)
+    return Response(content=content, media_type=media_type, headers={"ETag": make_etag(key)})
 
-        # If sampling rate is provided in the request, override the config
-        final_sampling_rate = samplingRate if samplingRate else config["samplingRate"]
+# PSD of the requested window, or the streaming estimate when no window is given
+async def compute_psd(count, sampling_rate, channel):
+    psd_engine = psd_engines[channel]
+    if count is None and psd_engine.segments > 0:
+        # Use the running estimate maintained by the WebSocket consumer
+        logger.info(f'Using streaming PSD over {psd_engine.segments} segments and sampling rate {sampling_rate}')
+        return psd_engine.estimate(sampling_rate)
 
-        # Estimate PSD and get the plot as a PNG
-        logger.info(f'Computing Periodogram using sample size {len(signal_data)} and sampling rate {final_sampling_rate}')
-        buf = estimate_psd(np.array(time_data), np.array(signal_data), final_sampling_rate)
+    # Read a snapshot of the most recent samples without consuming them,
+    # so concurrent clients all see the same buffer
+    signal_data = snapshot_signal(count, channel)
+    if len(signal_data) == 0:
+        return None
+    logger.info(f'Computing PSD using sample size {len(signal_data)} and sampling rate {sampling_rate}')
+    return await run_in_render_pool(welch_psd, signal_data, sampling_rate)
+
+# Serve Spectrum plot with an optional sampling rate and analysis window
+@app.get("/periodogram")
+async def plot_periodogram(request: Request, samplingRate: int = None, samples: int = None, seconds: float = None,
+                           channel: int = 0):
+    check_channel(channel)
+    # If sampling rate is provided in the request, override the config
+    final_sampling_rate = samplingRate if samplingRate else default_sampling_rate()
+    count = window_length(samples, seconds, final_sampling_rate)
+    psd_engine = psd_engines[channel]
+
+    # Identical polls with no new data are answered from the cache
+    key = (data_version(count, channel), count, final_sampling_rate, NFFT, "png")
+    cached = cached_response(request, key)
+    if cached is not None:
+        return cached
+
+    try:
+        logger.info("/periodogram endpoint called.")
+
+        if count is None and psd_engine.segments > 0:
+            # Plot the running estimate maintained by the WebSocket consumer
+            logger.info(f'Rendering streaming Periodogram over {psd_engine.segments} segments and sampling rate {final_sampling_rate}')
+            buf = await run_in_render_pool(render_psd, *psd_engine.estimate(final_sampling_rate))
+        else:
+            signal_data = snapshot_signal(count, channel)
+            if len(signal_data) == 0:
+                return {"error": "No data available"}
+
+            # Estimate PSD and get the plot as a PNG in a single round trip to the pool
+            logger.info(f'Computing Periodogram using sample size {len(signal_data)} and sampling rate {final_sampling_rate}')
+            buf = await run_in_render_pool(estimate_psd, None, signal_data, final_sampling_rate)
 
         logger.info("Periodogram successfully generated")
-        return Response(content=buf.getvalue(), media_type="image/png")
+        return cache_response(key, buf.getvalue(), "image/png")
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"An error occurred: {e}")
         return {"error": str(e)}  # Log the error
 
+# Serve the PSD as data (JSON or little-endian float32 binary) for client-side plotting
+@app.get("/psd")
+async def get_psd(request: Request, samplingRate: int = None, samples: int = None, seconds: float = None,
+                  format: str = "json", db: bool = False, maxBins: int = None, channel: int = 0):
+    check_channel(channel)
+    if format not in ("json", "binary"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'binary'")
+    if maxBins is not None and maxBins <= 0:
+        raise HTTPException(status_code=400, detail="maxBins must be positive")
+
+    final_sampling_rate = samplingRate if samplingRate else default_sampling_rate()
+    count = window_length(samples, seconds, final_sampling_rate)
+
+    key = (data_version(count, channel), count, final_sampling_rate, NFFT, format, db, maxBins)
+    cached = cached_response(request, key)
+    if cached is not None:
+        return cached
+
+    psd = await compute_psd(count, final_sampling_rate, channel)
+    if psd is None:
+        return {"error": "No data available"}
+    freqs, power = psd
+    if maxBins is not None:
+        freqs, power = decimate_bins(freqs, power, maxBins)
+    if db:
+        power = to_db(power)
+
+    if format == "binary":
+        return cache_response(key, pack_psd(freqs, power), "application/octet-stream")
+    content = json.dumps({
+        "samplingRate": final_sampling_rate,
+        "channel": channel,
+        "unit": "dB/Hz" if db else "V^2/Hz",
+        "frequencies": freqs.astype(np.float32).tolist(),
+        "power": power.astype(np.float32).tolist(),
+    })
+    return cache_response(key, content.encode(), "application/json")
+
+# Min/max/mean envelope of the last samples or seconds as at most `points` points, for plotting long windows
+@app.get("/envelope")
+async def get_envelope(samples: int = None, seconds: float = None, points: int = None, samplingRate: int = None,
+                       channel: int = 0):
+    check_channel(channel)
+    points = points if points else config.get("maxPoints", 100)
+    if points <= 0:
+        raise HTTPException(status_code=400, detail="points must be positive")
+    final_sampling_rate = samplingRate if samplingRate else default_sampling_rate()
+    span = window_length(samples, seconds, final_sampling_rate) or MAX_QUEUE_SIZE
+
+    pyramid = pyramids[channel]
+    if span < points * pyramid.base:
+        # Short windows are summarised straight from the raw samples
+        n, signal = data_buffers[channel].latest(span)
+        n, low, high, mean, width = raw_envelope(n, signal, points)
+    else:
+        n, low, high, mean, width = pyramid.envelope(span, points)
+    return {
+        "channel": channel,
+        "samplesPerPoint": int(width),
+        "n": n.tolist(),
+        "min": low.tolist(),
+        "max": high.tolist(),
+        "mean": mean.tolist(),
+    }
+
+# Fundamental period and frequency of the last samples or seconds, e.g. to check a function generator change
+@app.get("/period")
+async def get_period(samples: int = None, seconds: float = None, samplingRate: int = None, method: str = "fft",
+                     channel: int = 0):
+    check_channel(channel)
+    if method not in PERIOD_METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be one of {', '.join(PERIOD_METHODS)}")
+    final_sampling_rate = samplingRate if samplingRate else default_sampling_rate()
+    count = window_length(samples, seconds, final_sampling_rate)
+    signal_data = snapshot_signal(count, channel)
+    period = estimate_period(signal_data, method) if len(signal_data) else None
+    return {
+        "channel": channel,
+        "samples": len(signal_data),
+        "samplingRate": final_sampling_rate,
+        "periodSamples": period,
+        "frequency": final_sampling_rate / period if period else None,
+    }
+
 # Serve the entire static directory (including images, CSS, JS)
 app.mount("/static", StaticFiles(directory=build_path / "static"), name="static")
 
@@ -163,22 +502,56 @@ async def serve_react_app(full_path: str):
 
 # WebSocket connection handling function
 MINIMUM_POINTS = 5000  # Number of points to accumulate
-MAX_QUEUE_SIZE = 50000  # Limit the size of the queue to prevent excessive memory use
+MAX_QUEUE_SIZE = 50000  # Capacity of the sample ring buffer of each channel
+MAX_CHANNELS = 4  # Channels carried by binary frames (GP26-GP28 and the temperature sensor)
+INGEST_QUEUE_SIZE = 1024  # Received messages waiting for processing before reading pauses
+STREAM_QUEUE_SIZE = 64  # Blocks queued per /ws/stream subscriber before its blocks are dropped
+STREAM_MAX_DROPS = 256  # Consecutive dropped blocks before a slow subscriber is disconnected
 
-async def websocket_consumer():
-    try:
-        uri = f"ws://{config['server']['host']}:{config['server']['port']}"
-        async with websockets.connect(uri) as websocket:
-            logger.info(f"Connected to WebSocket at {uri}")
+NODE_SERVER_URL = "http://localhost"  # Node.js server hosting the function generator
+NODE_TIMEOUT = 2.0  # Seconds per control request
+NODE_RETRIES = 2  # Extra attempts after a connection error or 5xx response
 
-            while True:
-                message = await websocket.recv()
-                data = json.loads(message)
-                data_queue.append(data)
+RENDER_WORKERS = 2  # Worker processes for PSD computation and plotting
+RENDER_QUEUE_SIZE = 8  # Maximum running plus queued render jobs before rejecting with 503
+RENDER_CACHE_SIZE = 32  # Rendered PSD responses kept for repeated polls
 
-                # Maintain the maximum queue size
-                if len(data_queue) > MAX_QUEUE_SIZE:
-                    data_queue.popleft()  # Remove old data to make room for new data
+CAPTURE_DIR = Path(__file__).resolve().parent.parent.parent / "data" / "captures"
+CAPTURE_SEGMENT_SAMPLES = 2**20  # Rows per segment file (12 MB: int64 n plus float32 signal)
+CAPTURE_MAX_BYTES = 2**30  # Oldest segments are deleted beyond this archive size
+CAPTURE_MAX_AGE = 7 * 24 * 3600  # ...or once they are older than this many seconds
+CAPTURE_FLUSH_INTERVAL = 5.0  # Seconds between flushes of the open segments
 
-    except Exception as e:
-        logger.error(f"Error in WebSocket consumer: {e}")
+CLASSIFIER_MODEL = Path(__file__).resolve().parent / "models" / "random_forest_model"  # Without extension
+CLASSIFIER_PERIOD_LENGTH = 100  # Samples per period for legacy models saved without their period length
+CLASSIFIER_BATCH_PERIODS = 8  # Periods classified together
+CLASSIFIER_WINDOW_PERIODS = 32  # Periods averaged into the rolling label
+CLASSIFIER_DETECT_PERIOD = True  # Re-estimate the period length on every batch
+
+PSD_OVERLAP = 0.5  # Fractional overlap of consecutive Welch segments
+PSD_AVERAGING = "fixed"  # "fixed" (last PSD_SEGMENTS segments) or "exponential"
+PSD_SEGMENTS = 32
+PSD_ALPHA = 0.1  # Weight of the newest segment for exponential averaging
+
+# Most recent samples and running PSD of each channel of the WebSocket stream
+data_buffers = [RingBuffer(MAX_QUEUE_SIZE) for _ in range(MAX_CHANNELS)]
+psd_engines = [StreamingWelch(overlap=PSD_OVERLAP, averaging=PSD_AVERAGING,
+                              num_segments=PSD_SEGMENTS, alpha=PSD_ALPHA) for _ in range(MAX_CHANNELS)]
+pyramids = [MinMaxPyramid() for _ in range(MAX_CHANNELS)]  # Multi-resolution envelopes for /envelope
+render_cache = RenderCache(RENDER_CACHE_SIZE)
+broadcaster = Broadcaster(STREAM_QUEUE_SIZE, STREAM_MAX_DROPS)  # Fan-out of the live stream to browsers
+
+# Append an ingested block to the per-channel buffers, PSD estimates and capture spool
+def ingest_block(n, channels, rate):
+    global stream_rate
+    if rate:
+        stream_rate = rate
+    for channel, signal in enumerate(channels[:MAX_CHANNELS]):
+        data_buffers[channel].append(n, signal)  # Oldest samples are overwritten when full
+        psd_engines[channel].update(signal)
+        pyramids[channel].append(n, signal)
+        if capture_store is not None:
+            capture_store.append(channel, n, signal, default_sampling_rate())
+    broadcaster.publish(n, channels)
+    if classifier is not None:
+        classifier.wake()
@@ -0,0 +1,360 @@
+# capture_store.py
+import json
+import logging
+import os
+import time
+from bisect import bisect_left, insort
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+N_SUFFIX = ".n.i8"  # Little-endian int64 sample numbers
+SIGNAL_SUFFIX = ".signal.f4"  # Little-endian float32 voltages
+META_SUFFIX = ".capture.json"  # Distinct from other JSON files kept next to training data
+META_KEYS = ("channel", "samplingRate", "label", "startN", "endN", "startTime", "endTime", "count", "capacity",
+             "closed")
+ROW_BYTES = np.dtype('<i8').itemsize + np.dtype('<f4').itemsize
+RATE_TOLERANCE = 0.01  # Relative rate change that starts new segments; measured rates jitter slightly
+
+
+class Segment:
+    """One fixed-size capture segment: two preallocated column files plus a JSON sidecar.
+
+    The columns are written through ``np.memmap``, so appending costs a copy
+    into the page cache and readers can map the same files without loading
+    them. The sidecar records the channel, sampling rate, label, sample and
+    wall-clock range and how many rows are valid. ``flush`` and ``close`` do
+    the disk I/O and may run in another thread than ``append``.
+    """
+
+    def __init__(self, directory, channel, capacity, sampling_rate, label, start_n, start_time):
+        self.stem = Path(directory) / f"ch{channel}_{int(start_time * 1000)}_{start_n}"
+        self.capacity = capacity
+        self.count = 0
+        self.meta = {
+            "stem": str(self.stem),
+            "channel": channel,
+            "samplingRate": sampling_rate,
+            "label": label,
+            "startN": int(start_n),
+            "endN": int(start_n),
+            "startTime": start_time,
+            "endTime": start_time,
+            "count": 0,
+            "capacity": capacity,
+            "closed": False,
+        }
+        self.n = np.memmap(str(self.stem) + N_SUFFIX, dtype='<i8', mode='w+', shape=(capacity,))
+        self.signal = np.memmap(str(self.stem) + SIGNAL_SUFFIX, dtype='<f4', mode='w+', shape=(capacity,))
+
+    # Write as many samples as fit; returns how many were written
+    def append(self, n, signal, now):
+        count = min(len(n), self.capacity - self.count)
+        self.n[self.count:self.count + count] = n[:count]
+        self.signal[self.count:self.count + count] = signal[:count]
+        self.count += count
+        self.meta["count"] = self.count
+        if count:
+            self.meta["endN"] = int(n[count - 1])
+            self.meta["endTime"] = now
+        return count
+
+    def full(self):
+        return self.count >= self.capacity
+
+    # Write the rows appended so far to disk, then `meta`, a copy of the metadata taken after they were appended,
+    # so the sidecar never counts rows that are not on disk
+    def flush(self, meta):
+        self.n.flush()
+        self.signal.flush()
+        write_sidecar(str(self.stem) + META_SUFFIX, meta)
+
+    def close(self, meta):
+        self.flush(meta)
+        del self.n, self.signal
+
+
+# Replace a sidecar atomically so readers never see a half-written file; "stem" is implied by the path
+def write_sidecar(path, meta):
+    temporary = path + ".tmp"
+    with open(temporary, 'w') as file:
+        json.dump({key: value for key, value in meta.items() if key != "stem"}, file)
+    os.replace(temporary, path)
+
+
+# Metadata of every segment in a capture directory, oldest first; each entry gains a "stem" key
+def list_segments(directory):
+    segments = []
+    for path in Path(directory).glob("*" + META_SUFFIX):
+        try:
+            with open(path) as file:
+                meta = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping unreadable capture sidecar {path}: {e}")
+            continue
+        missing = [key for key in META_KEYS if key not in meta] if isinstance(meta, dict) else list(META_KEYS)
+        if missing:
+            logger.warning(f"Skipping {path}, which lacks the capture sidecar keys {missing}")
+            continue
+        meta["stem"] = str(path)[:-len(META_SUFFIX)]
+        segments.append(meta)
+    segments.sort(key=lambda meta: (meta["startTime"], meta["channel"]))
+    return segments
+
+
+# Map the valid rows of a segment read-only, without loading them; returns (n, signal)
+def open_segment(meta):
+    count = meta["count"]
+    if count == 0:
+        return np.empty(0, dtype='<i8'), np.empty(0, dtype='<f4')
+    n = np.memmap(meta["stem"] + N_SUFFIX, dtype='<i8', mode='r', shape=(count,))
+    signal = np.memmap(meta["stem"] + SIGNAL_SUFFIX, dtype='<f4', mode='r', shape=(count,))
+    return n, signal
+
+
+# Memory-mapped (meta, n, signal) for the stored segments, optionally of one channel and/or label
+def load_captures(directory, channel=None, label=None):
+    captures = []
+    for meta in list_segments(directory):
+        if channel is not None and meta["channel"] != channel:
+            continue
+        if label is not None and meta["label"] != label:
+            continue
+        n, signal = open_segment(meta)
+        captures.append((meta, n, signal))
+    return captures
+
+
+# Sample number of a segment at a wall-clock time, interpolated between the arrivals of its first and last blocks
+# and clamped to its range; `fraction` places the time in a segment whose blocks all arrived at once
+def _sample_at(meta, time, fraction):
+    duration = meta["endTime"] - meta["startTime"]
+    if duration > 0:
+        fraction = min(max((time - meta["startTime"]) / duration, 0.0), 1.0)
+    return meta["startN"] + fraction * (meta["endN"] - meta["startN"])
+
+
+# Rows of a segment's (n, signal) inside the given wall-clock and sample-number bounds, as a slice
+def segment_rows(meta, n, start_time=None, end_time=None, start_n=None, end_n=None):
+    low, high = -np.inf, np.inf
+    if start_n is not None:
+        low = start_n
+    if end_n is not None:
+        high = end_n
+    # Samples are timed by the recorded sample numbers and arrival times rather than the nominal sampling rate,
+    # which is not updated when the source's rate changes
+    if start_time is not None:
+        low = max(low, np.ceil(_sample_at(meta, start_time, 0.0)))
+    if end_time is not None:
+        high = min(high, np.floor(_sample_at(meta, end_time, 1.0)))
+    return slice(np.searchsorted(n, low, side='left'), np.searchsorted(n, high, side='right'))
+
+
+class SegmentIndex:
+    """In-memory index of the sample-number and wall-clock range of every stored segment.
+
+    Segments are kept per channel in recording order. A channel's segments
+    never overlap in time, so time-range lookups bisect on their end times;
+    sample-number bounds are checked per candidate because a restarted source
+    counts from zero again. Entries are the segments' live metadata, so the
+    ranges of open segments stay current without touching the disk.
+    """
+
+    def __init__(self, segments=()):
+        self._channels = {}
+        for meta in segments:
+            self.add(meta)
+
+    def add(self, meta):
+        insort(self._channels.setdefault(meta["channel"], []), meta, key=lambda meta: meta["startTime"])
+
+    def remove(self, meta):
+        self._channels[meta["channel"]].remove(meta)
+
+    # All segments, oldest first, optionally of one channel
+    def segments(self, channel=None):
+        if channel is not None:
+            return list(self._channels.get(channel, []))
+        return sorted((meta for segments in self._channels.values() for meta in segments),
+                      key=lambda meta: (meta["startTime"], meta["channel"]))
+
+    def overlapping(self, channel, start_time=None, end_time=None, start_n=None, end_n=None):
+        """Non-empty segments of ``channel`` holding samples inside all the given bounds, oldest first."""
+        segments = self._channels.get(channel, [])
+        first = 0
+        if start_time is not None:
+            first = bisect_left(segments, start_time, key=lambda meta: meta["endTime"])
+        matches = []
+        for meta in segments[first:]:
+            if end_time is not None and meta["startTime"] > end_time:
+                break
+            if meta["count"] == 0:
+                continue
+            if start_n is not None and meta["endN"] < start_n:
+                continue
+            if end_n is not None and meta["startN"] > end_n:
+                continue
+            matches.append(meta)
+        return matches
+
+
+# Samples of a channel inside the given bounds as an iterator of (meta, n, signal) chunks of at most
+# `chunk_rows` rows. The overlapping segments are looked up immediately and only they are opened, lazily,
+# so the iterator can be consumed in another thread.
+def query_captures(index, channel, start_time=None, end_time=None, start_n=None, end_n=None, chunk_rows=65536):
+    segments = index.overlapping(channel, start_time, end_time, start_n, end_n)
+    return _read_segments(segments, start_time, end_time, start_n, end_n, chunk_rows)
+
+
+def _read_segments(segments, start_time, end_time, start_n, end_n, chunk_rows):
+    for meta in segments:
+        n, signal = open_segment(meta)
+        rows = segment_rows(meta, n, start_time, end_time, start_n, end_n)
+        for start in range(rows.start, rows.stop, chunk_rows):
+            stop = min(start + chunk_rows, rows.stop)
+            yield meta, n[start:stop], signal[start:stop]
+
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Capture write failed: {future.exception()}")
+
+
+# Delete the column files and sidecar of a segment
+def remove_segment(stem):
+    for suffix in (N_SUFFIX, SIGNAL_SUFFIX, META_SUFFIX):
+        try:
+            os.remove(stem + suffix)
+        except FileNotFoundError:
+            pass
+
+
+class CaptureStore:
+    """Spools ingested samples of every channel to rotating fixed-size segments on disk.
+
+    Each channel writes to one open segment of ``segment_samples`` rows. A
+    segment is closed and a new one started when it is full, when the
+    sampling rate changes or when the label changes, so every segment holds a
+    single rate and label. After each rotation the oldest closed segments are
+    deleted while the archive exceeds ``max_bytes`` or they are older than
+    ``max_age`` seconds. Only the copy into the memory-mapped columns happens
+    in the caller, e.g. the event loop: flushing, closing and deleting
+    segments run in order on one writer thread.
+    """
+
+    def __init__(self, directory, segment_samples=2**20, max_bytes=2**30, max_age=7 * 24 * 3600):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_samples = segment_samples
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.label = None
+        self.sampling_rate = None
+        self.samples = 0  # Samples written since start
+        self.removed_segments = 0  # Segments deleted by the retention limits
+        self._open = {}  # Channel -> open Segment
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture-writer")
+        self.index = SegmentIndex(self._recover())
+        self.enforce_retention()
+
+    # Mark segments left open by a previous run as closed (their sidecar count is the last flushed one)
+    # and return the metadata of every stored segment
+    def _recover(self):
+        segments = list_segments(self.directory)
+        for meta in segments:
+            if not meta["closed"]:
+                meta["closed"] = True
+                write_sidecar(meta["stem"] + META_SUFFIX, meta)
+        return segments
+
+    def append(self, channel, n, signal, sampling_rate):
+        n = np.atleast_1d(np.asarray(n, dtype=np.int64))
+        signal = np.atleast_1d(np.asarray(signal, dtype=np.float32))
+        if self.sampling_rate is None or abs(sampling_rate - self.sampling_rate) > RATE_TOLERANCE * self.sampling_rate:
+            self.sampling_rate = sampling_rate
+            self.rotate()
+        now = time.time()
+        while len(n):
+            segment = self._open.get(channel)
+            if segment is not None and segment.count and n[0] <= segment.meta["endN"]:
+                # The source restarted its counter; keep sample numbers increasing within a segment
+                self._close(channel)
+                segment = None
+            if segment is None:
+                segment = Segment(self.directory, channel, self.segment_samples, sampling_rate, self.label,
+                                  n[0], now)
+                self._open[channel] = segment
+                self.index.add(segment.meta)
+                self._submit(write_sidecar, str(segment.stem) + META_SUFFIX, dict(segment.meta))
+            written = segment.append(n, signal, now)
+            n, signal = n[written:], signal[written:]
+            self.samples += written
+            if segment.full():
+                self._close(channel)
+                self.enforce_retention()
+
+    def set_label(self, label):
+        """Label the samples recorded from now on; starts new segments so labels never mix."""
+        if label != self.label:
+            self.label = label
+            self.rotate()
+
+    # Close the open segment of every channel; the next append starts new ones
+    def rotate(self):
+        for channel in list(self._open):
+            self._close(channel)
+        self.enforce_retention()
+
+    def _close(self, channel):
+        segment = self._open.pop(channel)
+        if segment.count == 0:
+            self.index.remove(segment.meta)
+            self._submit(remove_segment, str(segment.stem))
+        else:
+            segment.meta["closed"] = True
+            self._submit(segment.close, dict(segment.meta))
+
+    # Run disk I/O on the writer thread after everything submitted before; failures are logged
+    def _submit(self, func, *args):
+        future = self._writer.submit(func, *args)
+        future.add_done_callback(_log_failure)
+        return future
+
+    # Persist the open segments' rows and counts, e.g. periodically; returns a concurrent.futures.Future that
+    # completes once they, and all earlier writes, are on disk
+    def flush(self):
+        for segment in self._open.values():
+            self._submit(segment.flush, dict(segment.meta))
+        return self._submit(lambda: None)
+
+    # Close every segment and wait for the writer thread to finish
+    def close(self):
+        self.rotate()
+        self._writer.shutdown(wait=True)
+
+    def enforce_retention(self):
+        segments = self.index.segments()
+        total = sum(meta["capacity"] * ROW_BYTES for meta in segments)
+        cutoff = time.time() - self.max_age
+        for meta in segments:  # Oldest first
+            if total <= self.max_bytes and meta["endTime"] >= cutoff:
+                break
+            if not meta["closed"]:
+                continue  # Still being written
+            self.index.remove(meta)
+            self._submit(remove_segment, meta["stem"])
+            total -= meta["capacity"] * ROW_BYTES
+            self.removed_segments += 1
+
+    def stats(self):
+        segments = self.index.segments()
+        return {
+            "directory": str(self.directory),
+            "label": self.label,
+            "samples": self.samples,
+            "segments": len(segments),
+            "bytes": sum(meta["capacity"] * ROW_BYTES for meta in segments),
+            "removedSegments": self.removed_segments,
+        }
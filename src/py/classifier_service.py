@@ -0,0 +1,149 @@
+# classifier_service.py
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from model_bundle import load_bundle
+from period_detection import estimate_period
+
+logger = logging.getLogger(__name__)
+
+
+class StreamClassifier:
+    """Classifies completed periods of a live ring buffer with a model bundle saved by train.py.
+
+    ``wake()`` is called after every ingested block. Once ``batch_periods``
+    complete periods have arrived since the last batch, a background task
+    copies them out of the buffer and runs feature extraction and
+    ``predict_proba`` on a dedicated worker thread, where the model stays
+    loaded and tree evaluation runs without the GIL, so ingestion never waits
+    for the model. The rolling label is the class with the highest mean
+    probability over the last ``window_periods`` periods; each new result is
+    passed to ``on_result``. With ``detect_period`` the period length is
+    re-estimated on every batch, so it follows changes of the generator
+    frequency; models trained on zero-crossing cycles always need it.
+    """
+
+    def __init__(self, model_path, buffer, period_length=None, batch_periods=8, window_periods=32, on_result=None,
+                 default_period_length=None, detect_period=True):
+        self.bundle = load_bundle(model_path)
+        self.buffer = buffer
+        # An explicit period length wins over the bundle's; the default covers legacy models saved without one
+        self.period_length = period_length or self.bundle.period_length or default_period_length
+        if self.period_length is None:
+            raise ValueError("period_length is required for models saved without one")
+        self.detect_period = detect_period or self.bundle.segmentation == 'zero_crossing'
+        self.batch_periods = batch_periods
+        self.on_result = on_result
+        self.result = None
+        self.batches = 0
+        self.periods = 0
+        self.skipped_samples = 0  # Overwritten in the buffer before they could be classified
+        self.errors = 0
+        self.last_error = None
+        self.last_latency = 0.0  # Seconds from taking a batch out of the buffer to its result
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+        self._probabilities = deque(maxlen=window_periods)
+        self._next_total = 0  # buffer.total at the start of the first unclassified period
+        self._wakeup = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._task = None
+
+    def start(self):
+        self._next_total = self.buffer.total  # Classify from now on
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._executor.shutdown(wait=False)
+
+    def wake(self):
+        if self.buffer.total - self._next_total >= self.batch_periods * self.period_length:
+            self._wakeup.set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            n, periods = self._take_periods()
+            if len(periods) == 0:
+                continue
+            started = time.perf_counter()
+            try:
+                probabilities = await loop.run_in_executor(self._executor, self._predict, periods)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                logger.error(f"Classification failed: {e}")
+                continue
+            self._record(time.perf_counter() - started, n, probabilities)
+
+    # Copy every complete period received since the last batch; returns (last sample number, periods)
+    def _take_periods(self):
+        available = self.buffer.total - self._next_total
+        if available > len(self.buffer):
+            self.skipped_samples += available - len(self.buffer)
+            available = len(self.buffer)
+        n, signal = self.buffer.latest(available)
+        if self.detect_period:
+            period = estimate_period(signal)
+            if period is not None:
+                self.period_length = max(round(period), 2)
+        periods, consumed = self.bundle.periods(signal, self.period_length)
+        last = int(n[consumed - 1]) if len(periods) else None
+        if self.bundle.segmentation == 'zero_crossing' and consumed < len(signal):
+            # Resume half a period before the last cycle start, so the next batch sees that cycle's whole rise
+            consumed = max(consumed - self.period_length // 2, 0)
+        self._next_total = self.buffer.total - available + consumed
+        return last, periods.copy()
+
+    # Runs on the worker thread: scale with the training scaler (legacy models: over the batch), build the features
+    def _predict(self, periods):
+        if self.bundle.scaler is not None:
+            scaled = self.bundle.scale(periods)
+        else:
+            scale = periods.std()
+            scaled = (periods - periods.mean()) / (scale if scale > 0 else 1.0) * self.bundle.scale_factor
+        return self.bundle.model.predict_proba(self.bundle.features(scaled))
+
+    def _record(self, latency, n, probabilities):
+        self.batches += 1
+        self.periods += len(probabilities)
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        self.total_latency += latency
+        self._probabilities.extend(probabilities)
+        mean = np.mean(self._probabilities, axis=0)
+        best = int(np.argmax(mean))
+        classes = self.bundle.classes
+        self.result = {
+            "label": str(classes[best]),
+            "confidence": float(mean[best]),
+            "probabilities": {str(label): float(p) for label, p in zip(classes, mean)},
+            "n": n,  # Last sample of the newest classified period
+            "periods": len(self._probabilities),
+        }
+        if self.on_result is not None:
+            self.on_result(self.result)
+
+    def stats(self):
+        return {
+            "periodLength": self.period_length,
+            "detectPeriod": self.detect_period,
+            "batchPeriods": self.batch_periods,
+            "batches": self.batches,
+            "periods": self.periods,
+            "pendingSamples": self.buffer.total - self._next_total,
+            "skippedSamples": self.skipped_samples,
+            "errors": self.errors,
+            "lastError": self.last_error,
+            "lastLatencyMs": self.last_latency * 1000,
+            "meanLatencyMs": self.total_latency / self.batches * 1000 if self.batches else 0.0,
+            "maxLatencyMs": self.max_latency * 1000,
+        }
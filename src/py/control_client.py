@@ -0,0 +1,76 @@
+# control_client.py
+import asyncio
+import logging
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class ControlClient:
+    """Pooled, keep-alive async HTTP client for control requests to the Node.js server."""
+
+    def __init__(self, base_url, timeout=2.0, retries=2, retry_delay=0.2):
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(max_connections=8, max_keepalive_connections=4),
+        )
+
+    async def post(self, path, payload):
+        """POST JSON, retrying transport errors and 5xx responses; returns the decoded response body."""
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self._client.post(path, json=payload)
+                if response.status_code < 500 or attempt == self.retries:
+                    response.raise_for_status()  # Raise an error for bad status codes
+                    if response.headers.get("content-type", "").startswith("application/json"):
+                        return response.json()
+                    return response.text
+            except httpx.TransportError as e:
+                if attempt == self.retries:
+                    raise
+                logger.warning(f"POST {path} failed ({e}), retrying")
+            await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+    async def close(self):
+        await self._client.aclose()
+
+
+class LatestValueSender:
+    """Coalesces rapid updates so only the most recent value is sent.
+
+    While a send is in flight, further submissions replace each other and
+    only the last one is sent when it completes. Every caller waits for the
+    send that carries its value or a newer one and gets that send's result.
+    """
+
+    def __init__(self, send):
+        self._send = send
+        self._latest = None
+        self._waiters = []
+        self._task = None
+
+    async def submit(self, value):
+        future = asyncio.get_running_loop().create_future()
+        self._latest = value
+        self._waiters.append(future)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._drain())
+        return await future
+
+    async def _drain(self):
+        while self._waiters:
+            value, waiters = self._latest, self._waiters
+            self._latest, self._waiters = None, []
+            try:
+                result = await self._send(value)
+            except Exception as e:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+            else:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(result)
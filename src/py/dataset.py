@@ -0,0 +1,103 @@
+# dataset.py
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+from capture_store import load_captures
+
+CACHE_DIR = ".cache"  # Created next to the CSV files
+CACHE_VERSION = 1  # Bump when the cached layout changes
+
+
+class Recording(NamedTuple):
+    """Typed columns of one or more recordings: sample numbers, voltages and labels."""
+    sample: np.ndarray  # int64
+    voltage: np.ndarray  # float64
+    label: np.ndarray  # str
+
+    def __len__(self):
+        return len(self.sample)
+
+    def to_frame(self):
+        return pd.DataFrame({'sample': self.sample, 'voltage': self.voltage, 'label': self.label})
+
+
+# Parse a recording CSV with the sample, voltage and optional label columns; unlabelled rows get an empty label
+def read_csv(path):
+    data = pd.read_csv(path, dtype={'sample': np.int64, 'voltage': np.float64, 'label': str})
+    if 'label' in data:
+        label = data['label'].fillna('').to_numpy(dtype=str)
+    else:
+        label = np.full(len(data), '')
+    return Recording(data['sample'].to_numpy(), data['voltage'].to_numpy(), label)
+
+
+def cache_path(path):
+    directory, filename = os.path.split(path)
+    return os.path.join(directory, CACHE_DIR, filename + '.npz')
+
+
+def load_csv(path, cache=True):
+    """Load a recording CSV, parsing it only if its binary cache is missing or stale.
+
+    The cache is an uncompressed ``.npz`` under ``.cache/`` next to the CSV,
+    keyed by the CSV's modification time and size. Labels are stored as codes
+    into a small table of names, so the arrays load without any text parsing.
+    """
+    stat = os.stat(path)
+    key = np.array([CACHE_VERSION, stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+    cached = cache_path(path)
+    if cache and os.path.exists(cached):
+        try:
+            with np.load(cached) as arrays:
+                if np.array_equal(arrays['key'], key):
+                    return Recording(arrays['sample'], arrays['voltage'], arrays['label_names'][arrays['label_codes']])
+        except (OSError, ValueError, KeyError):
+            pass  # Unreadable cache, parse again
+
+    recording = read_csv(path)
+    if cache:
+        label_names, label_codes = np.unique(recording.label, return_inverse=True)
+        temporary = cached + '.tmp.npz'
+        try:
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            np.savez(temporary, key=key, sample=recording.sample, voltage=recording.voltage,
+                     label_names=label_names, label_codes=label_codes.astype(np.int32))
+            os.replace(temporary, cached)  # Concurrent runs never see a partial cache
+        except OSError:
+            pass  # Read-only data directory, parse again next time
+    return recording
+
+
+def load_directory(directory, labelled_only=False, workers=None, cache=True):
+    """Load every CSV (in parallel, through the binary cache) and capture segment in a directory.
+
+    Returns a single Recording, CSVs in name order followed by captures in
+    recording order. Unlabelled rows and captures get an empty label, or are
+    skipped when ``labelled_only`` is set. Raises ValueError if nothing was
+    found.
+    """
+    paths = [os.path.join(directory, filename) for filename in sorted(os.listdir(directory))
+             if filename.endswith('.csv')]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        recordings = list(executor.map(lambda path: load_csv(path, cache), paths))
+
+    # Capture segments spooled by the backend, read through memory maps
+    for meta, n, signal in load_captures(directory):
+        if meta['label'] is None and labelled_only:
+            continue
+        label = np.full(len(n), meta['label'] or '')
+        recordings.append(Recording(np.asarray(n, dtype=np.int64), np.asarray(signal, dtype=np.float64), label))
+
+    if not recordings:
+        raise ValueError("No CSV files or captures found in the specified directory.")
+    recording = Recording(*(np.concatenate(column) for column in zip(*recordings)))
+    if labelled_only:
+        recording = Recording(*(column[recording.label != ''] for column in recording))
+    return recording
+
+
+# DataFrame with the sample, voltage and label columns, as the training and prediction scripts expect
+def load_data_from_directory(directory, labelled_only=False, workers=None, cache=True):
+    return load_directory(directory, labelled_only, workers, cache).to_frame()
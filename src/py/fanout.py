@@ -0,0 +1,142 @@
+# fanout.py
+import asyncio
+import json
+import logging
+import numpy as np
+from starlette.websockets import WebSocketDisconnect
+
+logger = logging.getLogger(__name__)
+
+
+# Pack a batch as little-endian binary: uint32 count, int64 sample numbers, float32 signal values
+def pack_samples(n, signal):
+    header = np.array([len(n)], dtype='<u4')
+    return header.tobytes() + np.asarray(n, dtype='<i8').tobytes() + np.asarray(signal, dtype='<f4').tobytes()
+
+
+class Subscriber:
+    """One viewer of the live stream with its own decimation settings and bounded queue."""
+
+    def __init__(self, websocket, channel, subsampling, max_points, binary, queue_size):
+        self.websocket = websocket
+        self.channel = channel
+        self.subsampling = max(1, subsampling)
+        self.max_points = max(1, max_points)
+        self.binary = binary
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.sent = 0
+        self.dropped = 0  # Blocks dropped because the queue was full
+        self.consecutive_drops = 0
+        self.task = None
+
+    # Queue the samples of a block this subscriber wants, dropping the block if it is behind
+    def offer(self, n, signal):
+        keep = n % self.subsampling == 0  # Decimate on the global sample number so blocks line up
+        if not keep.any():
+            return
+        try:
+            self.queue.put_nowait((n[keep], signal[keep]))
+            self.consecutive_drops = 0
+        except asyncio.QueueFull:
+            self.dropped += 1
+            self.consecutive_drops += 1
+
+    # Queue a JSON event (e.g. a classification) to send after the samples queued before it
+    def notify(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def update(self, settings):
+        if "subsampling" in settings:
+            self.subsampling = max(1, int(settings["subsampling"]))
+        if "maxPoints" in settings:
+            self.max_points = max(1, int(settings["maxPoints"]))
+
+
+class Broadcaster:
+    """Fans ingested blocks out to any number of WebSocket subscribers.
+
+    Each subscriber gets a bounded queue that ``publish`` fills without ever
+    waiting, so a slow viewer cannot hold up ingestion or the other viewers:
+    its blocks are dropped, and after ``max_consecutive_drops`` in a row it is
+    disconnected. A sender task per subscriber drains everything queued and
+    sends it as one message holding at most ``max_points`` samples, followed by
+    any events announced in the meantime.
+    """
+
+    def __init__(self, queue_size=64, max_consecutive_drops=256):
+        self.queue_size = queue_size
+        self.max_consecutive_drops = max_consecutive_drops
+        self.subscribers = set()
+
+    def publish(self, n, channels):
+        for subscriber in list(self.subscribers):
+            if subscriber.channel < len(channels):
+                subscriber.offer(n, np.asarray(channels[subscriber.channel]))
+                if subscriber.consecutive_drops > self.max_consecutive_drops and subscriber.task:
+                    logger.warning("Dropping slow stream subscriber")
+                    subscriber.task.cancel()
+
+    # Send a JSON event such as {"classification": {...}} to every subscriber
+    def announce(self, event):
+        for subscriber in list(self.subscribers):
+            subscriber.notify(event)
+
+    async def serve(self, websocket, channel, subsampling, max_points, binary):
+        """Stream to an accepted WebSocket until it disconnects or falls too far behind."""
+        subscriber = Subscriber(websocket, channel, subsampling, max_points, binary, self.queue_size)
+        self.subscribers.add(subscriber)
+        subscriber.task = asyncio.create_task(self._send(subscriber))
+        receiver = asyncio.create_task(self._receive(subscriber))
+        try:
+            await asyncio.wait([subscriber.task, receiver], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.subscribers.discard(subscriber)
+            subscriber.task.cancel()
+            receiver.cancel()
+            await asyncio.gather(subscriber.task, receiver, return_exceptions=True)
+        if subscriber.consecutive_drops > self.max_consecutive_drops:
+            try:
+                await websocket.close(code=1013)  # Try again later
+            except Exception:
+                pass
+
+    async def _send(self, subscriber):
+        while True:
+            batch = [await subscriber.queue.get()]
+            while not subscriber.queue.empty():
+                batch.append(subscriber.queue.get_nowait())
+            blocks = [item for item in batch if isinstance(item, tuple)]
+            if blocks:
+                n = np.concatenate([block[0] for block in blocks])[-subscriber.max_points:]
+                signal = np.concatenate([block[1] for block in blocks])[-subscriber.max_points:]
+                if subscriber.binary:
+                    await subscriber.websocket.send_bytes(pack_samples(n, signal))
+                else:
+                    await subscriber.websocket.send_text(json.dumps({"n": n.tolist(), "signal": signal.tolist()}))
+                subscriber.sent += len(n)
+            # Events always go out as JSON text, also to binary subscribers
+            for event in batch:
+                if isinstance(event, dict):
+                    await subscriber.websocket.send_text(json.dumps(event))
+
+    # Apply settings sent by the client, e.g. {"subsampling": 4, "maxPoints": 200}
+    async def _receive(self, subscriber):
+        try:
+            while True:
+                message = await subscriber.websocket.receive_text()
+                try:
+                    subscriber.update(json.loads(message))
+                except (ValueError, TypeError) as e:
+                    logger.warning(f"Ignoring invalid stream settings {message!r}: {e}")
+        except WebSocketDisconnect:
+            pass
+
+    def stats(self):
+        return [
+            {"channel": s.channel, "subsampling": s.subsampling, "maxPoints": s.max_points,
+             "binary": s.binary, "sent": s.sent, "dropped": s.dropped, "queued": s.queue.qsize()}
+            for s in self.subscribers
+        ]
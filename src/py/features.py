@@ -0,0 +1,177 @@
+# features.py
+from fractions import Fraction
+from functools import lru_cache
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import resample, resample_poly
+from period_detection import zero_crossing_periods
+
+RESAMPLE_METHODS = ('linear', 'fft', 'polyphase')
+FEATURE_SETS = ('raw', 'spectral')
+RAW_LAYOUT = ('period', 'first_derivative', 'second_derivative')  # Blocks of one resampled period each
+OCTAVE_BANDS = 6  # Harmonics 1, 2-3, 4-7, ... 32-63
+HARMONIC_RATIOS = 4  # Power of harmonics 2-5 relative to the fundamental
+INVARIANCE_TOLERANCE = 1e-6  # Largest spectral feature difference check_length_invariance accepts
+SPECTRAL_LAYOUT = (('rms', 'crest_factor', 'zero_crossing_rate', 'skewness', 'kurtosis')
+                   + tuple(f'band_power_{band}' for band in range(OCTAVE_BANDS))
+                   + tuple(f'harmonic_ratio_{harmonic}' for harmonic in range(2, HARMONIC_RATIOS + 2)))
+
+
+# Windows of `period_length` samples starting every `hop` samples (default: back to back), as a strided view
+def frame_periods(signal, period_length, hop=None):
+    hop = hop or period_length
+    signal = np.asarray(signal)
+    if len(signal) < period_length:
+        return np.empty((0, period_length), dtype=signal.dtype)
+    return sliding_window_view(signal, period_length)[::hop]
+
+
+# Left neighbour indices and weights of `length` points spread evenly from the first to the last of `source_length`
+@lru_cache(maxsize=32)
+def _linear_grid(source_length, length):
+    positions = np.linspace(0, source_length - 1, length)
+    left = np.minimum(positions.astype(np.intp), max(source_length - 2, 0))
+    return left, positions - left
+
+
+def resample_periods(periods, length, method='linear'):
+    """Resample every row of a (num_periods, period_length) array to ``length`` samples in one pass.
+
+    ``linear`` interpolates between neighbouring samples on a grid that maps
+    the first and last samples onto each other, like ``interp1d`` over
+    ``linspace``; the grid is computed once per shape. ``fft`` and
+    ``polyphase`` use scipy's band-limited resamplers along axis 1 and treat
+    each row as one period of a periodic signal: ``fft`` by construction,
+    ``polyphase`` by wrapping the row around its edges instead of zero-padding.
+    """
+    periods = np.asarray(periods, dtype=float)
+    source_length = periods.shape[1]
+    if method == 'linear':
+        if source_length == 1:
+            return np.repeat(periods, length, axis=1)
+        left, weight = _linear_grid(source_length, length)
+        return periods[:, left] * (1 - weight) + periods[:, left + 1] * weight
+    if method == 'fft':
+        return resample(periods, length, axis=1)
+    if method == 'polyphase':
+        ratio = Fraction(length, source_length)
+        return resample_poly(periods, ratio.numerator, ratio.denominator, axis=1, padtype='wrap')
+    raise ValueError(f"Unknown resampling method {method!r}, expected one of {RESAMPLE_METHODS}")
+
+
+# Each period followed by its first and second derivatives, computed for all rows at once
+def derivative_features(periods):
+    first_derivative = np.gradient(periods, axis=1)
+    second_derivative = np.gradient(first_derivative, axis=1)
+    return np.concatenate([periods, first_derivative, second_derivative], axis=1)
+
+
+def spectral_features(periods):
+    """Compact descriptors of each row of a (num_periods, period_length) array, one row of SPECTRAL_LAYOUT each.
+
+    RMS, crest factor, zero crossings per period (counted around the cycle,
+    last sample back to first), skewness and kurtosis of the mean-removed
+    period, the fraction of its power in octave bands of harmonics and the
+    power of harmonics 2-5 relative to the fundamental. With one period per
+    row, FFT bin ``k`` is harmonic ``k`` whatever the sampling rate or period
+    length, so their number does not grow with the period. Periods too short
+    to hold the higher harmonics leave those bands empty, so ModelBundle
+    resamples every period to the training length first.
+    """
+    periods = np.asarray(periods, dtype=float)
+    centred = periods - periods.mean(axis=1, keepdims=True)
+    variance = np.mean(centred ** 2, axis=1)
+    rms = np.sqrt(variance)
+    safe_rms = np.where(rms > 0, rms, 1.0)
+    crest_factor = np.abs(centred).max(axis=1) / safe_rms
+    negative = np.signbit(centred)
+    zero_crossing_rate = np.count_nonzero(negative != np.roll(negative, -1, axis=1), axis=1)
+    skewness = np.mean(centred ** 3, axis=1) / safe_rms ** 3
+    kurtosis = np.mean(centred ** 4, axis=1) / safe_rms ** 4
+
+    power = np.abs(np.fft.rfft(centred, axis=1)) ** 2
+    total = power[:, 1:].sum(axis=1)
+    total = np.where(total > 0, total, 1.0)
+    bands = np.zeros((len(periods), OCTAVE_BANDS))
+    for band in range(OCTAVE_BANDS):
+        # Empty when the period is too short to hold these harmonics
+        bands[:, band] = power[:, 2 ** band:2 ** (band + 1)].sum(axis=1) / total
+    fundamental = power[:, 1] if power.shape[1] > 1 else np.zeros(len(periods))
+    fundamental = np.where(fundamental > 0, fundamental, 1.0)
+    ratios = np.zeros((len(periods), HARMONIC_RATIOS))
+    available = min(HARMONIC_RATIOS, max(power.shape[1] - 2, 0))
+    ratios[:, :available] = power[:, 2:2 + available] / fundamental[:, None]
+
+    return np.column_stack([rms, crest_factor, zero_crossing_rate, skewness, kurtosis, bands, ratios])
+
+
+# Features of a (num_periods, period_length) array for a feature set
+def period_features(periods, feature_set='raw'):
+    if feature_set == 'raw':
+        return derivative_features(periods)
+    if feature_set == 'spectral':
+        return spectral_features(periods)
+    raise ValueError(f"Unknown feature set {feature_set!r}, expected one of {FEATURE_SETS}")
+
+
+def labelled_period_features(data, period_length, hop=None, feature_set='raw', segmentation='fixed'):
+    """Features of the periods of each label's voltage, in order of first appearance.
+
+    ``data`` has the voltage and label columns of the training data; periods
+    never straddle two labels. ``fixed`` periods are windows of
+    ``period_length`` samples every ``hop`` samples; ``zero_crossing`` ones
+    are each label's own cycles resampled to ``period_length`` samples, so
+    labels recorded at different frequencies line up. Returns (features,
+    labels) with one row per period and ``3 * period_length`` columns for raw
+    features or ``len(SPECTRAL_LAYOUT)`` for spectral ones.
+    """
+    voltage = data['voltage'].to_numpy()
+    labels = data['label'].to_numpy()
+    features = []
+    period_labels = []
+    for label in data['label'].unique():
+        if segmentation == 'zero_crossing':
+            periods, _ = zero_crossing_periods(voltage[labels == label], period_length)
+        else:
+            periods = frame_periods(voltage[labels == label], period_length, hop)
+        features.append(period_features(periods, feature_set))
+        period_labels.append(np.full(len(periods), label))
+    if not features:
+        width = 3 * period_length if feature_set == 'raw' else len(SPECTRAL_LAYOUT)
+        return np.empty((0, width)), np.empty(0, dtype=labels.dtype)
+    return np.concatenate(features), np.concatenate(period_labels)
+
+
+# One period of test waveforms made of harmonics 1-4, sampled at `length` points; the band limit lets the fft
+# resampler rebuild them exactly from as few as 10 samples
+def _test_waveforms(length):
+    phase = 2 * np.pi * (np.arange(length) / length + 0.1)
+    harmonics = np.arange(1, 5)[:, None] * phase
+    return np.stack([np.sin(phase),
+                     np.sin(harmonics[[0, 2]]).T @ [1, 1 / 3],
+                     np.sin(harmonics).T @ (1 / np.arange(1, 5)),
+                     np.cos(harmonics).T @ [1, 0.5, 0.25, 0.8]])
+
+
+def check_length_invariance(lengths=(10, 25, 50, 200, 400), reference_length=100):
+    """Largest difference between the spectral features ModelBundle computes for test waveforms sampled at
+    ``reference_length`` and for the same waveforms sampled at each of ``lengths``, resampled with ``fft``."""
+    from model_bundle import ModelBundle
+    bundle = ModelBundle(None, None, desired_period_length=reference_length, feature_set='spectral')
+    reference = bundle.features(_test_waveforms(reference_length), 'fft')
+    return {length: float(np.abs(bundle.features(_test_waveforms(length), 'fft') - reference).max())
+            for length in lengths}
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Check that spectral features do not depend on the period length.')
+    parser.add_argument('--tolerance', type=float, default=INVARIANCE_TOLERANCE,
+                        help=f'Largest accepted feature difference (default: {INVARIANCE_TOLERANCE}).')
+    args = parser.parse_args()
+
+    differences = check_length_invariance()
+    for length, difference in differences.items():
+        print(f"Period length {length}: max feature difference {difference:.2e}")
+    if max(differences.values()) > args.tolerance:
+        raise SystemExit("Spectral features depend on the period length")
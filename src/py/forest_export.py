@@ -0,0 +1,206 @@
+# forest_export.py
+import importlib.util
+import struct
+import time
+from pathlib import Path
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+from dataset import load_directory
+from period_detection import estimate_period
+from model_bundle import load_bundle
+
+MICROPYTHON_FOREST = Path(__file__).resolve().parent.parent / "micropy" / "server" / "forest.py"
+MICROPYTHON_MAGIC = b'WSRF'
+MICROPYTHON_VERSION = 1
+MICROPYTHON_HEADER = struct.Struct('<4sHHIIHH')  # Must match FOREST_HEADER in the MicroPython evaluator
+PREDICT_CHUNK_ROWS = 4096  # Rows evaluated together; bounds the (row, tree) working arrays
+
+
+def export_forest(model, class_names):
+    """Flatten a fitted RandomForestClassifier into contiguous arrays.
+
+    All trees share one node numbering: ``roots`` holds the first node of each
+    tree, ``feature`` the split feature (-1 for leaves), ``threshold`` the
+    split value, ``left``/``right`` the children and ``leaf`` each leaf's row in
+    ``values``, the per-leaf class probabilities in ``model.classes_`` order.
+    ``depth`` bounds the number of steps from a root to a leaf.
+    """
+    roots, features, thresholds, lefts, rights, leaves, values = [], [], [], [], [], [], []
+    node_offset = 0
+    leaf_offset = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        is_leaf = tree.children_left < 0
+        roots.append(node_offset)
+        features.append(np.where(is_leaf, -1, tree.feature))
+        thresholds.append(tree.threshold)
+        lefts.append(np.where(is_leaf, -1, tree.children_left + node_offset))
+        rights.append(np.where(is_leaf, -1, tree.children_right + node_offset))
+        leaves.append(np.where(is_leaf, np.cumsum(is_leaf) - 1 + leaf_offset, -1))
+        counts = tree.value[is_leaf, 0, :]
+        values.append(counts / counts.sum(axis=1, keepdims=True))  # Older sklearn stores counts, not fractions
+        node_offset += tree.node_count
+        leaf_offset += int(is_leaf.sum())
+    return {
+        'roots': np.array(roots, dtype=np.int32),
+        'feature': np.concatenate(features).astype(np.int32),
+        'threshold': np.concatenate(thresholds).astype(np.float64),
+        'left': np.concatenate(lefts).astype(np.int32),
+        'right': np.concatenate(rights).astype(np.int32),
+        'leaf': np.concatenate(leaves).astype(np.int32),
+        'values': np.concatenate(values),
+        'depth': np.array(max(estimator.tree_.max_depth for estimator in model.estimators_), dtype=np.int32),
+        'n_features': np.array(model.n_features_in_, dtype=np.int32),
+        'classes': np.asarray(class_names, dtype=str),
+    }
+
+
+def save_forest(path, forest):
+    np.savez(path, **forest)
+
+
+def load_forest(path):
+    with np.load(path) as arrays:
+        return dict(arrays)
+
+
+def predict_proba_forest(forest, X, chunk_rows=PREDICT_CHUNK_ROWS):
+    """Class probabilities of every row of X, walking all trees for a chunk of rows at a time.
+
+    Each (row, tree) pair descends one level per step. Leaves point back to
+    themselves, so pairs that reached one can wait at no cost, and the active
+    set is compacted whenever a third of it has finished. X is read
+    feature-major, so pairs at the same split read neighbouring values.
+    """
+    X = np.asarray(X, dtype=np.float32)  # sklearn compares float32 features against the thresholds
+    is_leaf = forest['feature'] < 0
+    node_ids = np.arange(len(is_leaf))
+    walk = {
+        'is_leaf': is_leaf,
+        'feature': np.where(is_leaf, 0, forest['feature']).astype(np.intp),
+        'threshold': np.where(is_leaf, np.inf, forest['threshold']),
+        'children': np.stack([np.where(is_leaf, node_ids, forest['left']),
+                              np.where(is_leaf, node_ids, forest['right'])], axis=1).ravel(),
+    }
+    probabilities = np.empty((len(X), forest['values'].shape[1]))
+    for start in range(0, len(X), chunk_rows):
+        probabilities[start:start + chunk_rows] = _predict_proba_chunk(forest, walk, X[start:start + chunk_rows])
+    return probabilities
+
+
+def _predict_proba_chunk(forest, walk, X):
+    n_rows = len(X)
+    n_trees = len(forest['roots'])
+    columns = X.T.ravel()
+    offsets = walk['feature'] * n_rows  # Start of each node's feature in `columns`
+    threshold, children, is_leaf = walk['threshold'], walk['children'], walk['is_leaf']
+    leaves = np.empty(n_rows * n_trees, dtype=np.intp)
+    pairs = np.arange(n_rows * n_trees)  # Tree-major: pair p is row p % n_rows of tree p // n_rows
+    nodes = np.repeat(forest['roots'].astype(np.intp), n_rows)
+    rows = np.tile(np.arange(n_rows), n_trees)
+    for _ in range(int(forest['depth'])):
+        at_leaf = is_leaf[nodes]
+        finished = np.count_nonzero(at_leaf)
+        if finished == len(nodes):
+            break
+        if finished * 3 > len(nodes):
+            leaves[pairs[at_leaf]] = nodes[at_leaf]
+            active = ~at_leaf
+            pairs, nodes, rows = pairs[active], nodes[active], rows[active]
+        go_right = columns[offsets[nodes] + rows] > threshold[nodes]
+        nodes = children[2 * nodes + go_right]
+    leaves[pairs] = nodes
+    total = np.zeros((n_rows, forest['values'].shape[1]))
+    for tree_leaves in forest['leaf'][leaves].reshape(n_trees, n_rows):
+        total += forest['values'][tree_leaves]
+    return total / n_trees
+
+
+# Write the compact little-endian file read by src/micropy/server/forest.py; thresholds become float32
+def write_micropython(path, forest):
+    n_classes = len(forest['classes'])
+    # Leaves keep their row of class probabilities in the left child slot
+    is_leaf = forest['feature'] < 0
+    left = np.where(is_leaf, forest['leaf'], forest['left'])
+    right = np.where(is_leaf, 0, forest['right'])
+    with open(path, 'wb') as file:
+        file.write(MICROPYTHON_HEADER.pack(MICROPYTHON_MAGIC, MICROPYTHON_VERSION, len(forest['roots']),
+                                           len(forest['feature']), len(forest['values']),
+                                           int(forest['n_features']), n_classes))
+        file.write(forest['roots'].astype('<u4').tobytes())
+        file.write(forest['feature'].astype('<i2').tobytes())
+        file.write(forest['threshold'].astype('<f4').tobytes())
+        file.write(left.astype('<u4').tobytes())
+        file.write(right.astype('<u4').tobytes())
+        file.write(forest['values'].astype('<f4').tobytes())
+        for name in forest['classes']:
+            encoded = str(name).encode()
+            file.write(bytes([len(encoded)]) + encoded)
+
+
+# Import the MicroPython evaluator under CPython so its results can be compared with sklearn
+def load_micropython_forest(path):
+    spec = importlib.util.spec_from_file_location('micropython_forest', MICROPYTHON_FOREST)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.Forest(path)
+
+
+def check_parity(bundle, forest, data_directory, period_length=None, micropython_path=None):
+    """Compare sklearn, the NumPy evaluator and optionally the MicroPython evaluator on a data directory."""
+    voltage = load_directory(data_directory).voltage
+    estimated = estimate_period(voltage) if period_length is None else None
+    period_length = period_length or (round(estimated) if estimated is not None else bundle.period_length)
+    if period_length is None:
+        raise ValueError("No periodic signal found, pass period_length explicitly")
+    scaler = None if bundle.scaler is not None else StandardScaler().fit(voltage[:, None])
+    periods, _ = bundle.periods(bundle.scale(voltage, scaler), period_length)
+    features = bundle.features(periods)
+
+    start = time.perf_counter()
+    expected = bundle.model.predict_proba(features)
+    sklearn_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    probabilities = predict_proba_forest(forest, features)
+    numpy_seconds = time.perf_counter() - start
+
+    agreement = np.mean(expected.argmax(axis=1) == probabilities.argmax(axis=1))
+    print(f"Periods: {len(features)}")
+    print(f"sklearn {sklearn_seconds * 1000:.1f} ms, NumPy evaluator {numpy_seconds * 1000:.1f} ms")
+    print(f"NumPy evaluator: label agreement {agreement:.4f}, "
+          f"max probability difference {np.abs(expected - probabilities).max():.2e}")
+    if micropython_path:
+        micropython_forest = load_micropython_forest(micropython_path)
+        predictions = np.array([micropython_forest.predict(row) for row in features.astype(np.float32).tolist()])
+        micropython_agreement = np.mean(expected.argmax(axis=1) == predictions)
+        print(f"MicroPython evaluator: label agreement {micropython_agreement:.4f}")
+        agreement = min(agreement, micropython_agreement)
+    return agreement
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Export a trained Random Forest model as flat arrays for fast inference.')
+    parser.add_argument('model_path', type=str, help='Path to the trained model without file extension.')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Where to write the NumPy arrays (default: <model_path>_forest.npz).')
+    parser.add_argument('--micropython', type=str, default=None,
+                        help='Also write the compact file read by src/micropy/server/forest.py.')
+    parser.add_argument('--check', type=str, default=None, metavar='DATA_DIRECTORY',
+                        help='Check that the exported evaluators agree with sklearn on this data, e.g. data/known.')
+    parser.add_argument('--period-length', type=int, default=None,
+                        help='Period length for --check (default: estimated from the data).')
+    args = parser.parse_args()
+
+    bundle = load_bundle(args.model_path)
+    forest = export_forest(bundle.model, bundle.classes)
+    output = args.output or f'{args.model_path}_forest.npz'
+    save_forest(output, forest)
+    print(f"Wrote {output}: {len(forest['roots'])} trees, {len(forest['feature'])} nodes, depth {forest['depth']}")
+    if args.micropython:
+        write_micropython(args.micropython, forest)
+        print(f"Wrote {args.micropython}")
+    if args.check:
+        agreement = check_parity(bundle, forest, args.check, args.period_length, args.micropython)
+        if agreement < 1.0:
+            raise SystemExit("Exported forest disagrees with sklearn")
@@ -0,0 +1,37 @@
+# frames.py
+import struct
+import numpy as np
+
+# Binary sample frames sent by the Pico (src/micropy/server/main.py), little-endian:
+#   uint8 version, uint8 channel count, uint16 samples per channel,
+#   uint32 index of the first sample, float32 sampling rate (Hz),
+#   then a float32 (scale, offset) pair per channel and the uint16 ADC codes,
+#   interleaved by channel. Voltages are code * scale + offset.
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct('<BBHIf')
+FRAME_CALIBRATION = np.dtype('<f4')
+
+
+class FrameError(ValueError):
+    pass
+
+
+# Decode a binary frame into (start index, sampling rate, voltages of shape (channels, count))
+def decode_frame(message):
+    if len(message) < FRAME_HEADER.size:
+        raise FrameError(f"Frame too short: {len(message)} bytes")
+    version, channels, count, start, rate = FRAME_HEADER.unpack_from(message)
+    if version != FRAME_VERSION:
+        raise FrameError(f"Unsupported frame version {version}")
+
+    calibration_size = 2 * channels * FRAME_CALIBRATION.itemsize
+    expected = FRAME_HEADER.size + calibration_size + 2 * channels * count
+    if len(message) != expected:
+        raise FrameError(f"Frame length {len(message)} does not match header (expected {expected})")
+
+    calibration = np.frombuffer(message, dtype=FRAME_CALIBRATION, count=2 * channels,
+                                offset=FRAME_HEADER.size).reshape(channels, 2).astype(np.float64)
+    codes = np.frombuffer(message, dtype='<u2', count=channels * count,
+                          offset=FRAME_HEADER.size + calibration_size).reshape(count, channels)
+    voltages = codes.T * calibration[:, :1] + calibration[:, 1:]
+    return start, rate, voltages
@@ -0,0 +1,177 @@
+# ingest.py
+import asyncio
+import json
+import logging
+import time
+import numpy as np
+import websockets
+from frames import decode_frame
+
+logger = logging.getLogger(__name__)
+
+
+# Decode a WebSocket message into (sample numbers, per-channel signals, sampling rate or None)
+def parse_message(message):
+    if isinstance(message, bytes):
+        # Batched binary frame of raw ADC codes, one row per channel
+        start, rate, voltages = decode_frame(message)
+        n = np.arange(start, start + voltages.shape[1], dtype=np.int64)
+        return n, voltages, rate
+    # JSON samples carry a single channel
+    data = json.loads(message)
+    return np.atleast_1d(np.asarray(data["n"], dtype=np.int64)), [np.atleast_1d(data["signal"])], None
+
+
+# Merge consecutive (n, channels, rate) blocks with the same channel count and rate into one block each
+def merge_blocks(blocks):
+    merged = []
+    run = []
+    for block in blocks:
+        if run and (len(block[1]) != len(run[0][1]) or block[2] != run[0][2]):
+            merged.append(_concatenate(run))
+            run = []
+        run.append(block)
+    if run:
+        merged.append(_concatenate(run))
+    return merged
+
+
+def _concatenate(run):
+    if len(run) == 1:
+        return run[0]
+    n = np.concatenate([block[0] for block in run])
+    channels = [np.concatenate(signals) for signals in zip(*(block[1] for block in run))]
+    return n, channels, run[0][2]
+
+
+class Ingestor:
+    """Supervised WebSocket ingestion with reconnects, gap detection and backpressure.
+
+    A receiver task keeps a connection to ``uri`` open, reconnecting with
+    exponential backoff, and puts received messages on a bounded queue. A
+    processor task drains everything queued, parses it and hands consecutive
+    blocks of the same layout to ``sink(n, channels, rate)`` as one
+    concatenated block, so the per-call cost of the sink is paid per batch
+    rather than per message. When the processor falls behind, the queue fills
+    up and the receiver stops reading from the socket, so backpressure reaches
+    the source instead of memory growing without bound.
+    """
+
+    def __init__(self, uri, sink, queue_size=256, min_backoff=0.5, max_backoff=30.0):
+        self.uri = uri
+        self.sink = sink
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.connected = False
+        self.connects = 0
+        self.messages = 0
+        self.samples = 0
+        self.gaps = 0  # Jumps forward in the sample counter
+        self.dropped_samples = 0  # Samples missing inside those jumps
+        self.restarts = 0  # Jumps backwards, e.g. the source restarted its counter
+        self.errors = 0
+        self.last_error = None
+        self.lag = 0.0  # Seconds between receiving and processing the oldest message of the latest batch
+        self.batches = 0  # Drains of the queue; each makes one sink call per block layout
+        self.max_queue_depth = 0
+        self._next_n = None
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._receive()), asyncio.create_task(self._process())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _receive(self):
+        backoff = self.min_backoff
+        while True:
+            try:
+                async with websockets.connect(self.uri) as websocket:
+                    logger.info(f"Connected to WebSocket at {self.uri}")
+                    self.connected = True
+                    self.connects += 1
+                    backoff = self.min_backoff
+                    async for message in websocket:
+                        # Waits while the queue is full, which stops reading from the socket
+                        await self.queue.put((time.monotonic(), message))
+                        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+                logger.warning(f"WebSocket at {self.uri} closed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                logger.error(f"Error in WebSocket consumer: {e}")
+            self.connected = False
+            logger.info(f"Reconnecting to {self.uri} in {backoff:.1f}s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def _process(self):
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                blocks = []
+                for _, message in batch:
+                    try:
+                        n, channels, rate = parse_message(message)
+                    except Exception as e:
+                        self._error(f"Failed to parse WebSocket message: {e}")
+                        continue
+                    self._check_sequence(n)
+                    self.messages += 1
+                    blocks.append((n, channels, rate))
+                for n, channels, rate in merge_blocks(blocks):
+                    try:
+                        self.sink(n, channels, rate)
+                        self.samples += len(n)
+                    except Exception as e:
+                        self._error(f"Failed to process WebSocket messages: {e}")
+                self.batches += 1
+            finally:
+                self.lag = time.monotonic() - batch[0][0]
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _error(self, message):
+        self.errors += 1
+        self.last_error = message
+        logger.error(message)
+
+    # Compare the first sample number of a block with the one expected after the previous block
+    def _check_sequence(self, n):
+        if len(n) == 0:
+            return
+        if self._next_n is not None:
+            if n[0] > self._next_n:
+                self.gaps += 1
+                self.dropped_samples += int(n[0] - self._next_n)
+            elif n[0] < self._next_n:
+                self.restarts += 1
+        self._next_n = int(n[-1]) + 1
+
+    def stats(self):
+        return {
+            "uri": self.uri,
+            "connected": self.connected,
+            "connects": self.connects,
+            "messages": self.messages,
+            "batches": self.batches,
+            "samples": self.samples,
+            "gaps": self.gaps,
+            "droppedSamples": self.dropped_samples,
+            "restarts": self.restarts,
+            "errors": self.errors,
+            "lastError": self.last_error,
+            "lagSeconds": self.lag,
+            "queueDepth": self.queue.qsize(),
+            "maxQueueDepth": self.max_queue_depth,
+            "queueSize": self.queue.maxsize,
+        }
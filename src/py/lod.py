@@ -0,0 +1,119 @@
+# lod.py
+import numpy as np
+
+
+class _Level:
+    """Mirrored ring of (start n, min, max, mean) buckets, like RingBuffer but with three value columns."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.n = np.zeros(2 * capacity, dtype=np.int64)
+        self.stats = np.zeros((2 * capacity, 3))
+        self.head = 0
+        self.size = 0
+
+    def append(self, n, stats):
+        if len(n) > self.capacity:
+            n, stats = n[-self.capacity:], stats[-self.capacity:]
+        count = len(n)
+        first = min(count, self.capacity - self.head)
+        for start, stop, offset in ((self.head, self.head + first, 0), (0, count - first, first)):
+            if stop <= start:
+                continue
+            length = stop - start
+            for base in (start, start + self.capacity):
+                self.n[base:base + length] = n[offset:offset + length]
+                self.stats[base:base + length] = stats[offset:offset + length]
+        self.head = (self.head + count) % self.capacity
+        self.size = min(self.size + count, self.capacity)
+
+    def latest(self, count):
+        count = min(count, self.size)
+        stop = self.head + self.capacity
+        return self.n[stop - count:stop], self.stats[stop - count:stop]
+
+
+# Envelope of raw samples as at most `points` buckets, for spans too short for the pyramid
+def raw_envelope(n, signal, points):
+    group = max(1, -(-len(signal) // points))
+    skip = len(signal) % group
+    blocks = signal[skip:].reshape(-1, group)
+    return n[skip::group], blocks.min(axis=1), blocks.max(axis=1), blocks.mean(axis=1), group
+
+
+# Reduce consecutive groups of `factor` buckets (rows of min, max, mean) to one bucket each
+def _reduce(stats, factor):
+    groups = stats[:len(stats) // factor * factor].reshape(-1, factor, 3)
+    return np.stack([groups[:, :, 0].min(axis=1), groups[:, :, 1].max(axis=1), groups[:, :, 2].mean(axis=1)], axis=1)
+
+
+class MinMaxPyramid:
+    """Multi-resolution min/max/mean envelope of a sample stream.
+
+    Level 0 summarises every ``base`` consecutive samples into one bucket and
+    each further level summarises ``factor`` buckets of the level below, so
+    level ``k`` buckets cover ``base * factor**k`` samples. Every level keeps the
+    last ``capacity`` buckets, so coarse levels reach back hours while each
+    append only touches O(new samples / base) buckets. ``envelope`` reads the
+    finest level that needs at most ``factor`` buckets per requested point, so
+    a query costs O(points * factor) whatever the time span.
+    """
+
+    def __init__(self, base=16, factor=4, levels=8, capacity=8192):
+        self.base = base
+        self.factor = factor
+        self.levels = [_Level(capacity) for _ in range(levels)]
+        # Samples (level 0) or buckets (higher levels) not yet summarised into the next level
+        self._pending_n = [np.empty(0, dtype=np.int64) for _ in range(levels)]
+        self._pending = [np.empty(0)] + [np.empty((0, 3)) for _ in range(levels - 1)]
+
+    def bucket_width(self, level):
+        return self.base * self.factor ** level
+
+    def append(self, n, signal):
+        n = np.atleast_1d(np.asarray(n, dtype=np.int64))
+        signal = np.atleast_1d(np.asarray(signal, dtype=float))
+
+        # Raw samples into level 0 buckets
+        n = np.concatenate([self._pending_n[0], n])
+        signal = np.concatenate([self._pending[0], signal])
+        full = len(signal) // self.base * self.base
+        self._pending_n[0], self._pending[0] = n[full:], signal[full:]
+        if full == 0:
+            return
+        blocks = signal[:full].reshape(-1, self.base)
+        bucket_n = n[:full:self.base]
+        stats = np.stack([blocks.min(axis=1), blocks.max(axis=1), blocks.mean(axis=1)], axis=1)
+        self.levels[0].append(bucket_n, stats)
+
+        # Each new run of `factor` buckets becomes one bucket of the next level
+        for level in range(1, len(self.levels)):
+            bucket_n = np.concatenate([self._pending_n[level], bucket_n])
+            stats = np.concatenate([self._pending[level], stats])
+            full = len(stats) // self.factor * self.factor
+            self._pending_n[level], self._pending[level] = bucket_n[full:], stats[full:]
+            if full == 0:
+                return
+            bucket_n = bucket_n[:full:self.factor]
+            stats = _reduce(stats[:full], self.factor)
+            self.levels[level].append(bucket_n, stats)
+
+    def envelope(self, span, points):
+        """Envelope of roughly the last ``span`` samples as at most ``points`` buckets.
+
+        Returns (start n, min, max, mean, samples per bucket); the span is
+        clamped to what the coarsest level still holds.
+        """
+        for level in range(len(self.levels)):
+            width = self.bucket_width(level)
+            buckets = -(-span // width)  # Ceiling division
+            if buckets <= points * self.factor and buckets <= self.levels[level].capacity:
+                break
+        n, stats = self.levels[level].latest(buckets)
+        group = max(1, -(-len(n) // points))
+        skip = len(n) % group  # Drop the oldest buckets so the groups line up with the newest data
+        n, stats = n[skip:], stats[skip:]
+        if group > 1:
+            n = n[::group]
+            stats = _reduce(stats, group)
+        return n, stats[:, 0], stats[:, 1], stats[:, 2], width * group
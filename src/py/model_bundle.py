@@ -0,0 +1,92 @@
+# model_bundle.py
+import joblib
+import numpy as np
+from features import frame_periods, resample_periods, period_features, RAW_LAYOUT, SPECTRAL_LAYOUT
+from period_detection import zero_crossing_periods
+
+BUNDLE_VERSION = 3  # 2 added the feature set, 3 the segmentation
+SCALE_FACTOR = 100  # Standardised voltages are multiplied by this before feature extraction
+
+
+class ModelBundle:
+    """A trained classifier together with everything needed to turn raw voltages into its features.
+
+    Saved by train.py as a single versioned ``{name}.joblib`` holding the
+    classifier, label encoder, fitted scaler, period lengths, feature set,
+    feature layout and segmentation, so prediction applies exactly the
+    training preprocessing and can run chunk by chunk. Models saved before
+    bundles existed (a bare classifier plus ``{name}_label_encoder.joblib``)
+    load as raw-feature models with ``scaler`` and ``period_length`` set to
+    None.
+    """
+
+    def __init__(self, model, label_encoder, scaler=None, period_length=None, desired_period_length=None,
+                 feature_set='raw', feature_layout=None, segmentation='fixed', scale_factor=SCALE_FACTOR):
+        self.model = model
+        self.label_encoder = label_encoder
+        self.scaler = scaler
+        self.period_length = period_length
+        self.feature_set = feature_set
+        if feature_layout is None:
+            feature_layout = RAW_LAYOUT if feature_set == 'raw' else SPECTRAL_LAYOUT
+        if desired_period_length is None and feature_set == 'raw':
+            desired_period_length = model.n_features_in_ // len(feature_layout)
+        if desired_period_length is None and segmentation == 'zero_crossing':
+            desired_period_length = period_length  # Cycles are resampled to the training length
+        self.desired_period_length = desired_period_length
+        self.feature_layout = tuple(feature_layout)
+        self.segmentation = segmentation
+        self.scale_factor = scale_factor
+
+    @property
+    def classes(self):
+        return self.label_encoder.classes_[self.model.classes_]
+
+    # Standardise raw voltages with the training scaler; `scaler` overrides it, e.g. for legacy models
+    def scale(self, voltage, scaler=None):
+        scaler = scaler or self.scaler
+        if scaler is None:
+            raise ValueError("This model was saved without its scaler")
+        return (np.asarray(voltage, dtype=float) - scaler.mean_[0]) / scaler.scale_[0] * self.scale_factor
+
+    # Cut scaled voltages into the periods the model was trained on: back-to-back windows of `period_length`
+    # samples, or every complete cycle between rising zero crossings resampled to the model's period length.
+    # Returns (periods, consumed), where samples from `consumed` on belong to the next, incomplete period
+    def periods(self, scaled, period_length):
+        if self.segmentation == 'zero_crossing':
+            cycles, end = zero_crossing_periods(scaled, self.desired_period_length)
+            return cycles, (len(scaled) if end is None else int(end))
+        periods = frame_periods(scaled, period_length)
+        return periods, len(periods) * period_length
+
+    # Features of scaled (num_periods, period_length) periods, first resampled to the training period length if
+    # needed so raw features have the model's input width and spectral ones see the same harmonics as in training
+    def features(self, periods, method='linear'):
+        if self.desired_period_length is not None and periods.shape[1] != self.desired_period_length:
+            periods = resample_periods(periods, self.desired_period_length, method)
+        return period_features(periods, self.feature_set)
+
+    def save(self, path):
+        joblib.dump({
+            'version': BUNDLE_VERSION,
+            'model': self.model,
+            'label_encoder': self.label_encoder,
+            'scaler': self.scaler,
+            'period_length': self.period_length,
+            'desired_period_length': self.desired_period_length,
+            'feature_set': self.feature_set,
+            'feature_layout': list(self.feature_layout),
+            'segmentation': self.segmentation,
+            'scale_factor': self.scale_factor,
+        }, f'{path}.joblib')
+
+
+def load_bundle(path):
+    """Load ``{path}.joblib`` as a ModelBundle, falling back to the legacy two-file layout."""
+    saved = joblib.load(f'{path}.joblib')
+    if isinstance(saved, dict):
+        version = saved.pop('version', None)
+        if version is None or version > BUNDLE_VERSION:
+            raise ValueError(f"Unsupported model bundle version {version} in {path}.joblib")
+        return ModelBundle(**saved)
+    return ModelBundle(saved, joblib.load(f'{path}_label_encoder.joblib'))
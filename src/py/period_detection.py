@@ -0,0 +1,146 @@
+# period_detection.py
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+PERIOD_METHODS = ('fft', 'autocorrelation')
+SEGMENTATIONS = ('fixed', 'zero_crossing')
+PERIOD_FRAME_LENGTH = 8192  # Samples per frame of the period estimate; longer signals get one estimate per frame
+MIN_PERIOD = 4  # Shortest detectable period in samples
+MIN_PEAK_RATIO = 10.0  # Spectral peak over the median magnitude below which a frame counts as aperiodic
+MIN_CORRELATION = 0.3  # Normalised autocorrelation at the period below which a frame counts as aperiodic
+PEAK_THRESHOLD = 0.8  # Autocorrelation peaks this close to the highest may be the period rather than a multiple
+SMOOTHING = 8  # Crossings are found on a moving average over this fraction of the period
+HYSTERESIS = 0.5  # Standard deviations above and below the mean the signal must cross to start a cycle
+CYCLE_TOLERANCE = 0.25  # Cycles further than this fraction from the local period span a gap and are dropped
+
+
+# Back-to-back frames of `frame_length` samples, or the whole signal as one frame when it is shorter
+def _frames(signal, frame_length):
+    if len(signal) <= frame_length:
+        return signal[None, :]
+    return sliding_window_view(signal, frame_length)[::frame_length]
+
+
+# Offset of the vertex of the parabola through each row's peak and its two neighbours, in samples or bins
+def _parabolic_offsets(values, peaks):
+    rows = np.arange(len(values))
+    left, centre, right = values[rows, peaks - 1], values[rows, peaks], values[rows, peaks + 1]
+    curvature = left - 2 * centre + right
+    return np.where(curvature < 0, 0.5 * (left - right) / np.where(curvature < 0, curvature, -1.0), 0.0)
+
+
+def estimate_periods(frames, method='fft', min_period=MIN_PERIOD):
+    """Fundamental period in samples of every row of a (num_frames, frame_length) array, NaN where there is none.
+
+    ``fft`` takes the strongest bin of the Hann-windowed spectrum and refines
+    it by parabolic interpolation of the log magnitude; ``autocorrelation``
+    takes the first autocorrelation peak after its first zero crossing that
+    comes within PEAK_THRESHOLD of the highest, computed through a zero-padded
+    FFT, and refines the lag the same way. Both handle all rows in one batched
+    FFT and need at least two periods per frame. Frames whose spectral peak is
+    less than MIN_PEAK_RATIO times the median magnitude, or whose normalised
+    autocorrelation at the period is below MIN_CORRELATION, such as noise or
+    an idle input, have no period.
+    """
+    frames = np.atleast_2d(np.asarray(frames, dtype=float))
+    length = frames.shape[1]
+    periods = np.full(len(frames), np.nan)
+    if length < 2 * min_period + 2:
+        return periods
+    centred = frames - frames.mean(axis=1, keepdims=True)
+    rows = np.arange(len(frames))
+    if method == 'fft':
+        spectrum = np.abs(np.fft.rfft(centred * np.hanning(length), axis=1))
+        low, high = 2, min(length // min_period, spectrum.shape[1] - 2)
+        band = spectrum[:, low:high + 1]
+        peaks = low + np.argmax(band, axis=1)
+        bins = peaks + _parabolic_offsets(np.log(np.maximum(spectrum, np.finfo(float).tiny)), peaks)
+        found = spectrum[rows, peaks] > MIN_PEAK_RATIO * np.median(band, axis=1)
+        periods[found] = length / bins[found]
+        return periods
+    if method == 'autocorrelation':
+        spectrum = np.fft.rfft(centred, n=2 * length, axis=1)
+        autocorrelation = np.fft.irfft(np.abs(spectrum) ** 2, axis=1)[:, :length // 2 + 1]
+        negative = autocorrelation < 0
+        lags = np.arange(autocorrelation.shape[1])
+        # Past the lobe around lag zero, multiples of the period can peak as high as the period itself when
+        # it is not a whole number of samples, so take the first local maximum close to the highest one
+        searched = (lags >= np.maximum(np.argmax(negative, axis=1), min_period)[:, None]) & (lags < lags[-1])
+        candidates = np.where(searched, autocorrelation, -np.inf)
+        local_maximum = np.zeros_like(searched)
+        local_maximum[:, 1:-1] = ((candidates[:, 1:-1] >= candidates[:, :-2])
+                                  & (candidates[:, 1:-1] > candidates[:, 2:]))
+        highest = candidates.max(axis=1, keepdims=True)
+        peaks = np.argmax(local_maximum & (candidates >= PEAK_THRESHOLD * highest), axis=1)
+        lag = peaks + _parabolic_offsets(autocorrelation, peaks)
+        energy = autocorrelation[:, 0]
+        found = (negative.any(axis=1) & (energy > 0)
+                 & (autocorrelation[rows, peaks] >= MIN_CORRELATION * energy))
+        periods[found] = lag[found]
+        return periods
+    raise ValueError(f"Unknown period estimation method {method!r}, expected one of {PERIOD_METHODS}")
+
+
+# Median fundamental period in samples over the frames of a signal; None when no frame is periodic
+def estimate_period(signal, method='fft', frame_length=PERIOD_FRAME_LENGTH):
+    periods = estimate_periods(_frames(np.asarray(signal, dtype=float), frame_length), method)
+    periods = periods[np.isfinite(periods)]
+    return float(np.median(periods)) if len(periods) else None
+
+
+def cycle_starts(signal, method='fft', frame_length=PERIOD_FRAME_LENGTH):
+    """Fractional sample positions where cycles start, with the local period at each.
+
+    A cycle starts where the signal, smoothed by a centred moving average over
+    1/SMOOTHING of the period, rises through its mean, interpolated between
+    the two samples around the crossing. Like a Schmitt trigger, only
+    rises from below ``-HYSTERESIS`` to above ``+HYSTERESIS`` standard
+    deviations count, at their last mean crossing, so noise around the mean
+    does not start extra cycles. The local period is estimated per frame.
+    """
+    signal = np.asarray(signal, dtype=float)
+    none = np.empty(0), np.empty(0)
+    if len(signal) < 2:
+        return none
+    frames = _frames(signal, frame_length)
+    frame_periods = estimate_periods(frames, method)
+    known = np.isfinite(frame_periods)
+    if not known.any():
+        return none
+    centres = np.arange(len(frames)) * frames.shape[1] + frames.shape[1] / 2
+
+    width = max(1, round(np.median(frame_periods[known]) / SMOOTHING))
+    centred = np.convolve(signal - signal.mean(), np.ones(width) / width, mode='same')
+    threshold = HYSTERESIS * centred.std()
+    outside = np.flatnonzero(np.abs(centred) > threshold)
+    high = centred[outside] > 0
+    rises = outside[1:][high[1:] & ~high[:-1]]
+    below = centred < 0
+    crossings = np.flatnonzero(below[:-1] & ~below[1:]) + 1
+    if len(rises) == 0:
+        return none
+    crossings = crossings[np.searchsorted(crossings, rises, side='right') - 1]
+    before, after = centred[crossings - 1], centred[crossings]
+    positions = crossings - 1 + before / (before - after)
+    return positions, np.interp(positions, centres[known], frame_periods[known])
+
+
+def zero_crossing_periods(signal, length, method='fft', frame_length=PERIOD_FRAME_LENGTH):
+    """Every complete cycle of a signal, from one rising mean crossing to the next, resampled to ``length`` samples.
+
+    Returns (cycles, end): a (num_cycles, length) array, linearly interpolated
+    in one pass, and the start of the last cycle found, where the next
+    incomplete one begins (None without any). Cycles whose length is far from
+    the local period, e.g. across a gap between recordings, are dropped.
+    """
+    signal = np.asarray(signal, dtype=float)
+    starts, periods = cycle_starts(signal, method, frame_length)
+    end = float(starts[-1]) if len(starts) else None
+    cycle_lengths = np.diff(starts)
+    complete = np.abs(cycle_lengths - periods[:-1]) <= CYCLE_TOLERANCE * periods[:-1]
+    if not complete.any():
+        return np.empty((0, length)), end
+    positions = starts[:-1][complete, None] + np.arange(length) / length * cycle_lengths[complete, None]
+    left = np.minimum(positions.astype(np.intp), len(signal) - 2)
+    weight = positions - left
+    return signal[left] * (1 - weight) + signal[left + 1] * weight, end
@@ -1,28 +1,186 @@
 # periodogram.py
 import numpy as np
-import matplotlib.pyplot as plt
 from io import BytesIO
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from numpy.lib.stride_tricks import sliding_window_view
 
 NFFT = 2**10
 
-def estimate_psd(time, signal, sampling_rate):
-    # Remove the DC component by subtracting the mean of the signal
+# Figure reused by render_psd; each render worker process keeps its own
+_figure = None
+_axes = None
+_line = None
+
+
+# Windowed, one-sided power spectra of every full segment in `data` (without the 1/fs density factor)
+def _segment_spectra(data, window, step):
+    nfft = len(window)
+    segments = sliding_window_view(data, nfft)[::step]
+    segments = segments - segments.mean(axis=1, keepdims=True)  # Remove the DC component per segment
+    spectra = np.abs(np.fft.rfft(segments * window, axis=1)) ** 2 / np.sum(window ** 2)
+    # Fold the negative frequencies into the one-sided spectrum (DC and Nyquist appear once)
+    spectra[:, 1:(nfft + 1) // 2] *= 2
+    return spectra
+
+
+class StreamingWelch:
+    """Welch PSD estimator that is updated incrementally as samples arrive.
+
+    Incoming samples are cut into Hann-windowed segments of ``nfft`` samples with
+    the given fractional ``overlap``. Segment spectra are either averaged over the
+    last ``num_segments`` segments (``averaging='fixed'``) or exponentially with
+    weight ``alpha`` on the newest segment (``averaging='exponential'``). The
+    estimate is kept independent of the sampling rate, which is only applied
+    when it is read, so reading is O(nfft) regardless of how much data was seen.
+    """
+
+    def __init__(self, nfft=NFFT, overlap=0.5, averaging='fixed', num_segments=32, alpha=0.1):
+        if not 0 <= overlap < 1:
+            raise ValueError("overlap must be in [0, 1)")
+        if averaging not in ('fixed', 'exponential'):
+            raise ValueError("averaging must be 'fixed' or 'exponential'")
+        self.nfft = nfft
+        self.step = nfft - int(nfft * overlap)
+        self.averaging = averaging
+        self.num_segments = num_segments
+        self.alpha = alpha
+        self._window = np.hanning(nfft)
+        self._tail = np.zeros(nfft)  # Samples not yet part of a complete segment
+        self._history = np.zeros((num_segments, nfft // 2 + 1))
+        self.generation = 0  # Incremented whenever the estimate changes, never reset
+        self.reset()
+
+    def reset(self):
+        self._fill = 0
+        self._history[:] = 0
+        self._sum = np.zeros(self.nfft // 2 + 1)
+        self._average = np.zeros(self.nfft // 2 + 1)
+        self._index = 0  # Next row of the history to overwrite
+        self.segments = 0  # Number of segments folded into the estimate
+        self.generation += 1
+
+    def update(self, signal):
+        """Feed new samples; complete segments are transformed and averaged immediately."""
+        signal = np.atleast_1d(np.asarray(signal, dtype=float))
+        if self._fill + len(signal) < self.nfft:
+            # Not enough for a new segment yet, just stash the samples
+            self._tail[self._fill:self._fill + len(signal)] = signal
+            self._fill += len(signal)
+            return
+
+        data = np.concatenate([self._tail[:self._fill], signal])
+        spectra = _segment_spectra(data, self._window, self.step)
+        consumed = len(spectra) * self.step
+        remainder = data[consumed:]
+        self._tail[:len(remainder)] = remainder
+        self._fill = len(remainder)
+
+        if self.averaging == 'fixed':
+            self._update_fixed(spectra)
+        else:
+            self._update_exponential(spectra)
+        self.segments += len(spectra)
+        self.generation += 1
+
+    def _update_fixed(self, spectra):
+        spectra = spectra[-self.num_segments:]
+        rows = (self._index + np.arange(len(spectra))) % self.num_segments
+        # Rows that are overwritten leave the running sum; unfilled rows are zero
+        self._sum += spectra.sum(axis=0) - self._history[rows].sum(axis=0)
+        self._history[rows] = spectra
+        self._index = (self._index + len(spectra)) % self.num_segments
+
+    def _update_exponential(self, spectra):
+        if self.segments == 0:
+            self._average = spectra[0].copy()
+            spectra = spectra[1:]
+        count = len(spectra)
+        if count == 0:
+            return
+        decay = 1 - self.alpha
+        weights = self.alpha * decay ** np.arange(count - 1, -1, -1)
+        self._average = decay ** count * self._average + weights @ spectra
+
+    def estimate(self, sampling_rate):
+        """Return (frequencies, psd) of the current estimate in V^2/Hz."""
+        freqs = np.fft.rfftfreq(self.nfft, d=1 / sampling_rate)
+        if self.averaging == 'fixed':
+            psd = self._sum / max(1, min(self.segments, self.num_segments))
+        else:
+            psd = self._average
+        return freqs, psd / sampling_rate
+
+
+# Welch PSD of a whole signal, averaging non-overlapping segments like matplotlib's psd()
+def welch_psd(signal, sampling_rate, nfft=NFFT, overlap=0.0):
+    signal = np.asarray(signal, dtype=float)
     signal = signal - np.mean(signal)
+    if len(signal) < nfft:
+        signal = np.pad(signal, (0, nfft - len(signal)))  # Zero-pad short signals
+    window = np.hanning(nfft)
+    spectra = _segment_spectra(signal, window, nfft - int(nfft * overlap))
+    freqs = np.fft.rfftfreq(nfft, d=1 / sampling_rate)
+    return freqs, spectra.mean(axis=0) / sampling_rate
+
+
+# Convert power to decibels, guarding against log(0)
+def to_db(psd):
+    return 10 * np.log10(np.maximum(psd, np.finfo(float).tiny))
+
+
+# Reduce a spectrum to at most `max_bins` bins by averaging groups of neighbouring bins
+def decimate_bins(freqs, psd, max_bins):
+    factor = -(-len(psd) // max_bins)  # Ceiling division
+    if factor <= 1:
+        return freqs, psd
+    pad = (-len(psd)) % factor
+    counts = np.full(-(-len(psd) // factor), factor)
+    counts[-1] -= pad
+
+    def group_mean(values):
+        return np.pad(values, (0, pad)).reshape(-1, factor).sum(axis=1) / counts
+
+    return group_mean(freqs), group_mean(psd)
 
-    # Calculate the sampling frequency
-    fs = sampling_rate
 
-    # Compute the Power Spectral Density (PSD) using Welch's method
-    fig, ax = plt.subplots()
-    ax.psd(signal, NFFT=NFFT, Fs=fs)
-    ax.set_xlabel('Frequency (Hz)')
-    ax.set_ylabel('Power Spectral Density (V^2/Hz)')
-    ax.set_title('Periodogram of the Signal (Welch Method)')
+# Pack a spectrum as little-endian binary: uint32 bin count, float32 frequencies, float32 powers
+def pack_psd(freqs, psd):
+    header = np.array([len(psd)], dtype='<u4')
+    return header.tobytes() + np.asarray(freqs, dtype='<f4').tobytes() + np.asarray(psd, dtype='<f4').tobytes()
+
+
+# Create the Agg figure once instead of building a new one for every plot
+def _get_figure():
+    global _figure, _axes, _line
+    if _figure is None:
+        _figure = Figure()
+        FigureCanvasAgg(_figure)
+        _axes = _figure.add_subplot()
+        _line, = _axes.plot([], [])
+        _axes.grid(True)
+        _axes.set_xlabel('Frequency (Hz)')
+        _axes.set_ylabel('Power Spectral Density (dB/Hz)')
+        _axes.set_title('Periodogram of the Signal (Welch Method)')
+    return _figure, _axes, _line
+
+
+# Render a PSD as a PNG plot in dB (not thread-safe: the figure is shared per process)
+def render_psd(freqs, psd):
+    fig, ax, line = _get_figure()
+    line.set_data(freqs, to_db(psd))
+    ax.relim()
+    ax.autoscale_view()
 
     # Save the plot to a BytesIO object
     buf = BytesIO()
-    plt.savefig(buf, format='png')
-    plt.close(fig)
+    fig.savefig(buf, format='png')
     buf.seek(0)
 
     return buf
+
+
+def estimate_psd(time, signal, sampling_rate):
+    # Compute the Power Spectral Density (PSD) using Welch's method and plot it
+    freqs, psd = welch_psd(signal, sampling_rate)
+    return render_psd(freqs, psd)
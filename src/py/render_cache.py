@@ -0,0 +1,46 @@
+# render_cache.py
+import hashlib
+import os
+from collections import OrderedDict
+
+# Generation counters in the cache keys restart at 0 with the process; mixing this into every ETag
+# keeps a tag from before a restart from matching different data after it
+PROCESS_NONCE = os.urandom(8).hex()
+
+
+class RenderCache:
+    """Small LRU cache of rendered responses keyed by data version and request parameters."""
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, content, media_type):
+        self._entries[key] = (content, media_type)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)  # Evict the least recently used entry
+
+
+# Strong ETag derived from the cache key; the output is fully determined by the key within this process
+def make_etag(key):
+    return '"' + hashlib.sha1((PROCESS_NONCE + repr(key)).encode()).hexdigest()[:20] + '"'
+
+
+# Check an If-None-Match header value (possibly a list or "*") against an ETag
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
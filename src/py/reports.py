@@ -0,0 +1,104 @@
+# reports.py
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.figure import Figure
+import seaborn as sns
+from sklearn.metrics import precision_recall_curve, roc_curve, auc
+
+
+# One row of plots per class: a period (as extracted features) and its two derivatives
+def draw_periods(fig, examples, period_length, predicted=False):
+    prefix = 'Predicted: ' if predicted else ''
+    axes = fig.subplots(len(examples), 3, squeeze=False)
+    for row, (label, features) in zip(axes, examples):
+        if features is None:
+            continue
+        row[0].plot(features[:period_length])
+        row[0].set_title(f'Single Period - {prefix}{label}')
+        row[1].plot(features[period_length:2*period_length])
+        row[1].set_title(f'First Derivative - {prefix}{label}')
+        row[2].plot(features[2*period_length:])
+        row[2].set_title(f'Second Derivative - {prefix}{label}')
+
+
+def draw_confusion_matrix(fig, cm, class_names):
+    ax = fig.add_subplot()
+    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', xticklabels=class_names, yticklabels=class_names, ax=ax)
+    ax.set_xlabel('Predicted')
+    ax.set_ylabel('True')
+    ax.set_title('Confusion Matrix')
+
+
+def draw_precision_recall(fig, true_labels, probabilities, class_names):
+    ax = fig.add_subplot()
+    for i, label in enumerate(class_names):
+        precision, recall, _ = precision_recall_curve(true_labels == i, probabilities[:, i])
+        ax.plot(recall, precision, label=f'{label}')
+    ax.set_xlabel('Recall')
+    ax.set_ylabel('Precision')
+    ax.set_title('Precision-Recall Curve')
+    ax.legend()
+
+
+def draw_roc(fig, true_labels, probabilities, class_names):
+    ax = fig.add_subplot()
+    for i, label in enumerate(class_names):
+        fpr, tpr, _ = roc_curve(true_labels == i, probabilities[:, i])
+        ax.plot(fpr, tpr, label=f'{label} (AUC = {auc(fpr, tpr):.2f})')
+    ax.plot([0, 1], [0, 1], 'k--')
+    ax.set_xlabel('False Positive Rate')
+    ax.set_ylabel('True Positive Rate')
+    ax.set_title('ROC Curve')
+    ax.legend()
+
+
+# Runs in the report process: draw into a figure that is not managed by pyplot and save it
+def _render(path, draw, figsize, args):
+    fig = Figure(figsize=figsize)
+    draw(fig, *args)
+    fig.tight_layout()
+    fig.savefig(path)
+    return path
+
+
+class Reporter:
+    """Sends figures to the screen, to PNG files in a directory, or nowhere.
+
+    With ``report_dir`` set, figures are drawn and saved by a background
+    process while the caller carries on, so headless runs never block on a
+    display and plotting stays off the critical path; ``close()`` waits for the
+    files. With ``plots`` false, figures are skipped entirely. Otherwise each
+    figure is shown with ``plt.show()`` as before.
+    """
+
+    def __init__(self, report_dir=None, plots=True):
+        self.report_dir = report_dir if plots else None
+        self.plots = plots
+        self._pool = None
+        self._futures = []
+        if self.report_dir:
+            os.makedirs(self.report_dir, exist_ok=True)
+            self._pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+
+    def figure(self, name, draw, *args, figsize=(10, 7)):
+        if not self.plots:
+            return
+        if self._pool is not None:
+            path = os.path.join(self.report_dir, f'{name}.png')
+            self._futures.append(self._pool.submit(_render, path, draw, figsize, args))
+            return
+        import matplotlib.pyplot as plt  # Only interactive runs need pyplot and a display
+        fig = plt.figure(figsize=figsize)
+        draw(fig, *args)
+        fig.tight_layout()
+        plt.show()
+
+    # Wait for the report files; returns their paths
+    def close(self):
+        if self._pool is None:
+            return []
+        paths = [future.result() for future in self._futures]
+        self._pool.shutdown()
+        self._pool = None
+        return paths
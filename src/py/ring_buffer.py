@@ -0,0 +1,75 @@
+# ring_buffer.py
+import numpy as np
+
+
+class RingBuffer:
+    """Fixed-capacity buffer of (n, signal) samples backed by preallocated NumPy arrays.
+
+    Every sample is written twice, at ``i`` and ``i + capacity``, so the most
+    recent ``capacity`` samples are always contiguous in memory and windowed
+    reads can be returned as views without copying.
+    """
+
+    def __init__(self, capacity, signal_dtype=np.float64):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = int(capacity)
+        self._n = np.zeros(2 * self.capacity, dtype=np.int64)
+        self._signal = np.zeros(2 * self.capacity, dtype=signal_dtype)
+        self._head = 0  # Next write position in [0, capacity)
+        self._size = 0
+        self.total = 0  # Number of samples ever appended
+        self.generation = 0  # Incremented whenever the contents change
+
+    def __len__(self):
+        return self._size
+
+    def append(self, n, signal):
+        """Append one or more samples; ``n`` and ``signal`` may be scalars or arrays."""
+        n = np.atleast_1d(np.asarray(n, dtype=np.int64))
+        signal = np.atleast_1d(np.asarray(signal, dtype=self._signal.dtype))
+        if n.shape != signal.shape:
+            raise ValueError("n and signal must have the same length")
+
+        count = len(signal)
+        if count == 0:
+            return
+        self.total += count
+        self.generation += 1
+        if count > self.capacity:
+            # Only the newest samples can fit
+            n = n[-self.capacity:]
+            signal = signal[-self.capacity:]
+            count = self.capacity
+
+        # Write the block in at most two pieces, mirroring each into the upper half
+        first = min(count, self.capacity - self._head)
+        for start, stop, offset in ((self._head, self._head + first, 0),
+                                    (0, count - first, first)):
+            if stop <= start:
+                continue
+            length = stop - start
+            self._n[start:stop] = n[offset:offset + length]
+            self._signal[start:stop] = signal[offset:offset + length]
+            self._n[start + self.capacity:stop + self.capacity] = n[offset:offset + length]
+            self._signal[start + self.capacity:stop + self.capacity] = signal[offset:offset + length]
+
+        self._head = (self._head + count) % self.capacity
+        self._size = min(self._size + count, self.capacity)
+
+    def latest(self, count=None):
+        """Return read-only views of the ``count`` most recent (n, signal) samples, oldest first."""
+        if count is None or count > self._size:
+            count = self._size
+        stop = self._head + self.capacity
+        start = stop - count
+        n = self._n[start:stop]
+        signal = self._signal[start:stop]
+        n.flags.writeable = False
+        signal.flags.writeable = False
+        return n, signal
+
+    def clear(self):
+        self._head = 0
+        self._size = 0
+        self.generation += 1
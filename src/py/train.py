@@ -1,35 +1,40 @@
+import time
+from contextlib import contextmanager
 import pandas as pd
 import numpy as np
-import os
+from joblib import cpu_count
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import classification_report, accuracy_score, confusion_matrix, precision_recall_curve, roc_curve, auc
-from sklearn.model_selection import cross_val_score, StratifiedKFold
-import joblib
-import matplotlib.pyplot as plt
-import seaborn as sns
+from sklearn.metrics import classification_report, accuracy_score, confusion_matrix
+from sklearn.model_selection import cross_val_predict, StratifiedKFold
+from sklearn.base import clone
+from dataset import load_data_from_directory
+from features import labelled_period_features, FEATURE_SETS
+from period_detection import estimate_period, SEGMENTATIONS
+from model_bundle import ModelBundle
+from reports import Reporter, draw_periods, draw_confusion_matrix, draw_precision_recall, draw_roc
+
+RANDOM_STATE = 42  # Seeds the noise, the folds and the forest so runs are reproducible
+CV_FOLDS = 5
 
 # Function to add Gaussian noise
-def add_gaussian_noise(data, mean=0, std=0.01):
-    noise = np.random.normal(mean, std, data.shape)
+def add_gaussian_noise(data, mean=0, std=0.01, random_state=None):
+    noise = np.random.default_rng(random_state).normal(mean, std, data.shape)
     return data + noise
 
-# Function to load and concatenate data from the directory
-def load_data_from_directory(directory):
-    all_data = []
-    for filename in os.listdir(directory):
-        if filename.endswith('.csv'):
-            filepath = os.path.join(directory, filename)
-            data = pd.read_csv(filepath)
-            all_data.append(data)
-
-    combined_data = pd.concat(all_data, ignore_index=True)
-    return combined_data
+# Record the wall time of a training stage
+@contextmanager
+def timed(stage, timings):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = time.perf_counter() - start
 
 # Preprocessing function
-def preprocess_data(data):
+def preprocess_data(data, random_state=RANDOM_STATE):
     scaler = StandardScaler()
-    data['voltage'] = add_gaussian_noise(data['voltage'].astype(float))  # Add noise here
+    data['voltage'] = add_gaussian_noise(data['voltage'].astype(float), random_state=random_state)  # Add noise here
     data['voltage'] = scaler.fit_transform(data[['voltage']]) * 100
 
     label_encoder = LabelEncoder()
@@ -37,39 +42,26 @@ def preprocess_data(data):
 
     return data, scaler, label_encoder
 
-# Function to extract single periods from each signal type and calculate derivatives
-def extract_single_periods(data, period_length):
-    periods = []
-    labels = []
-    for label in data['label'].unique():
-        class_data = data[data['label'] == label]
-        num_periods = len(class_data) // period_length
-        for i in range(num_periods):
-            period = class_data.iloc[i * period_length:(i + 1) * period_length]['voltage'].values
-            first_derivative = np.gradient(period)
-            second_derivative = np.gradient(first_derivative)
-            features = np.concatenate([period, first_derivative, second_derivative])
-            periods.append(features)
-            labels.append(label)
-
-    return np.array(periods), np.array(labels)
-
-# Function to split test data into segments of the same length as the period and calculate derivatives
-def split_test_data(test_data, period_length):
-    segments = []
-    labels = []
-    for label in test_data['label'].unique():
-        class_data = test_data[test_data['label'] == label]
-        num_segments = len(class_data) // period_length
-        for i in range(num_segments):
-            segment = class_data.iloc[i * period_length:(i + 1) * period_length]['voltage'].values
-            first_derivative = np.gradient(segment)
-            second_derivative = np.gradient(first_derivative)
-            features = np.concatenate([segment, first_derivative, second_derivative])
-            segments.append(features)
-            labels.append(label)
-
-    return np.array(segments), np.array(labels)
+# Function to estimate the period length of each signal type; the period length is their median
+def estimate_period_length(data):
+    voltage = data['voltage'].to_numpy()
+    labels = data['label'].to_numpy()
+    periods = {label: estimate_period(voltage[labels == label]) for label in data['label'].unique()}
+    print("Estimated periods: " + ", ".join(f"{label} {period:.2f}" for label, period in periods.items()
+                                            if period is not None))
+    periods = [period for period in periods.values() if period is not None]
+    if not periods:
+        raise ValueError("No periodic signal found, pass period_length explicitly")
+    return round(float(np.median(periods)))
+
+# Function to extract single periods from each signal type and calculate their features
+# (the period and its derivatives, or spectral descriptors); a hop shorter than the period gives overlapping periods
+def extract_single_periods(data, period_length, hop=None, feature_set='raw', segmentation='fixed'):
+    return labelled_period_features(data, period_length, hop, feature_set, segmentation)
+
+# Function to split test data into segments of the same length as the period and calculate their features
+def split_test_data(test_data, period_length, feature_set='raw', segmentation='fixed'):
+    return labelled_period_features(test_data, period_length, feature_set=feature_set, segmentation=segmentation)
 
 # Function to split the data into training and testing sets
 def split_data(data, test_size=0.2):
@@ -83,59 +75,79 @@ def split_data(data, test_size=0.2):
     return train_data, test_data
 
 # Main function
-def main(directory, model_output_name, period_length):
-    data = load_data_from_directory(directory)
+def main(directory, model_output_name, period_length=None, hop=None, report_dir=None, plots=True, feature_set='raw',
+         segmentation='fixed'):
+    reporter = Reporter(report_dir, plots)
+    timings = {}
+    with timed('load', timings):
+        data = load_data_from_directory(directory, labelled_only=True)
     print(f"Data before preprocessing:\n{data.head()}")
 
-    data, scaler, label_encoder = preprocess_data(data)
+    # Detect the period length when it is not given
+    if period_length is None:
+        with timed('period detection', timings):
+            period_length = estimate_period_length(data)
+        print(f"Period length: {period_length}")
+
+    with timed('preprocess', timings):
+        data, scaler, label_encoder = preprocess_data(data)
     print(f"Data after preprocessing:\n{data.head()}")
 
     # Split the data into training and test sets
-    train_data, test_data = split_data(data)
+    with timed('split', timings):
+        train_data, test_data = split_data(data)
     print(f"Train Data:\n{train_data.head()}")
     print(f"Test Data:\n{test_data.head()}")
 
     # Extract single periods for training
-    train_periods, train_labels = extract_single_periods(train_data, period_length)
-    test_segments, test_labels = split_test_data(test_data, period_length)
+    with timed('features', timings):
+        train_periods, train_labels = extract_single_periods(train_data, period_length, hop, feature_set, segmentation)
+        test_segments, test_labels = split_test_data(test_data, period_length, feature_set, segmentation)
 
     print(f"Train Periods:\n{train_periods[:5]}")
     print(f"Train Labels:\n{train_labels[:5]}")
 
-    # Visualize the signals
-    fig, axes = plt.subplots(len(label_encoder.classes_), 3, figsize=(15, 10))
-    labels = label_encoder.classes_
-    for i, label in enumerate(labels):
-        period_signal = train_periods[train_labels == i][0][:period_length]
-        first_derivative = train_periods[train_labels == i][0][period_length:2*period_length]
-        second_derivative = train_periods[train_labels == i][0][2*period_length:]
-        axes[i, 0].plot(period_signal)
-        axes[i, 0].set_title(f'Single Period - {label}')
-        axes[i, 1].plot(first_derivative)
-        axes[i, 1].set_title(f'First Derivative - {label}')
-        axes[i, 2].plot(second_derivative)
-        axes[i, 2].set_title(f'Second Derivative - {label}')
-
-    plt.tight_layout()
-    plt.show()
+    # Visualize the signals (raw features are the period and its derivatives)
+    if feature_set == 'raw':
+        reporter.figure('example_periods', draw_periods,
+                        [(label, train_periods[train_labels == i][0]) for i, label in enumerate(label_encoder.classes_)],
+                        period_length, figsize=(15, 10))
 
     # Flatten the periods for training
     train_periods = train_periods.reshape(len(train_periods), -1)
     test_segments = test_segments.reshape(len(test_segments), -1)
 
-    # Train the Random Forest model with cross-validation
-    rf_model = RandomForestClassifier(n_estimators=100, random_state=42)
-    skf = StratifiedKFold(n_splits=5, shuffle=True, random_state=42)
-    cv_scores = cross_val_score(rf_model, train_periods, train_labels, cv=skf, scoring='accuracy')
+    # Cross-validate all folds at once, splitting the cores between them: each fold's forest builds its trees on
+    # its share, so the folds neither oversubscribe nor leave cores idle. Fold scores come from the cached
+    # out-of-fold probabilities.
+    rf_model = RandomForestClassifier(n_estimators=100, random_state=RANDOM_STATE, n_jobs=-1)
+    if hop is not None and hop < period_length and segmentation == 'fixed':
+        # Overlapping windows share samples, so shuffled folds would validate on samples the model was trained on;
+        # keep each class's windows in contiguous, unshuffled folds instead
+        skf = StratifiedKFold(n_splits=CV_FOLDS)
+    else:
+        skf = StratifiedKFold(n_splits=CV_FOLDS, shuffle=True, random_state=RANDOM_STATE)
+    with timed('cross-validation', timings):
+        fold_model = clone(rf_model).set_params(n_jobs=max(1, cpu_count() // CV_FOLDS))
+        cv_probabilities = cross_val_predict(fold_model, train_periods, train_labels, cv=skf,
+                                             method='predict_proba', n_jobs=-1)
+        cv_pred = np.unique(train_labels)[cv_probabilities.argmax(axis=1)]
+        cv_scores = np.array([accuracy_score(train_labels[fold], cv_pred[fold])
+                              for _, fold in skf.split(train_periods, train_labels)])
 
     print(f"Cross-Validation Scores: {cv_scores}")
     print(f"Mean Cross-Validation Score: {cv_scores.mean():.4f}")
+    print(f"Out-of-Fold Accuracy: {accuracy_score(train_labels, cv_pred):.4f}")
 
-    # Fit the model on the entire training data
-    rf_model.fit(train_periods, train_labels)
+    # Fit the model on the entire training data, building trees on all cores
+    with timed('fit', timings):
+        rf_model.fit(train_periods, train_labels)
 
-    train_pred = rf_model.predict(train_periods)
-    test_pred = rf_model.predict(test_segments)
+    # One inference pass per set; every test metric and curve below reuses these probabilities
+    with timed('evaluate', timings):
+        train_pred = rf_model.predict(train_periods)
+        test_probabilities = rf_model.predict_proba(test_segments)
+        test_pred = rf_model.classes_[test_probabilities.argmax(axis=1)]
 
     print(f"Train Accuracy: {accuracy_score(train_labels, train_pred):.4f}")
     print(f"Test Accuracy: {accuracy_score(test_labels, test_pred):.4f}")
@@ -143,51 +155,46 @@ def main(directory, model_output_name, period_length):
     print("Classification Report for Test Data:")
     print(classification_report(test_labels, test_pred, target_names=label_encoder.classes_))
 
-    # Save the model and label encoder
-    joblib.dump(rf_model, f'{model_output_name}.joblib')
-    joblib.dump(label_encoder, f'{model_output_name}_label_encoder.joblib')
+    # Save the model with its label encoder, scaler, period lengths and segmentation as one bundle; the saved
+    # forest predicts on one thread, since live batches of a few periods cost less than dispatching to all cores
+    rf_model.set_params(n_jobs=None)
+    with timed('save', timings):
+        ModelBundle(rf_model, label_encoder, scaler, period_length, period_length,
+                    feature_set=feature_set, segmentation=segmentation).save(model_output_name)
+    print("Wall time per stage: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items()))
 
     # Confusion Matrix
     cm = confusion_matrix(test_labels, test_pred)
-    plt.figure(figsize=(10, 7))
-    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', xticklabels=label_encoder.classes_, yticklabels=label_encoder.classes_)
-    plt.xlabel('Predicted')
-    plt.ylabel('True')
-    plt.title('Confusion Matrix')
-    plt.show()
+    reporter.figure('confusion_matrix', draw_confusion_matrix, cm, label_encoder.classes_)
 
     # Precision-Recall Curve
-    plt.figure(figsize=(10, 7))
-    for i, label in enumerate(label_encoder.classes_):
-        precision, recall, _ = precision_recall_curve(test_labels == i, rf_model.predict_proba(test_segments)[:, i])
-        plt.plot(recall, precision, label=f'{label}')
-
-    plt.xlabel('Recall')
-    plt.ylabel('Precision')
-    plt.title('Precision-Recall Curve')
-    plt.legend()
-    plt.show()
+    reporter.figure('precision_recall', draw_precision_recall, test_labels, test_probabilities, label_encoder.classes_)
 
     # ROC Curve
-    plt.figure(figsize=(10, 7))
-    for i, label in enumerate(label_encoder.classes_):
-        fpr, tpr, _ = roc_curve(test_labels == i, rf_model.predict_proba(test_segments)[:, i])
-        roc_auc = auc(fpr, tpr)
-        plt.plot(fpr, tpr, label=f'{label} (AUC = {roc_auc:.2f})')
-
-    plt.plot([0, 1], [0, 1], 'k--')
-    plt.xlabel('False Positive Rate')
-    plt.ylabel('True Positive Rate')
-    plt.title('ROC Curve')
-    plt.legend()
-    plt.show()
+    reporter.figure('roc', draw_roc, test_labels, test_probabilities, label_encoder.classes_)
+
+    for path in reporter.close():
+        print(f"Wrote {path}")
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description='Train a Random Forest model on signal data.')
     parser.add_argument('directory', type=str, help='Directory containing the CSV files.')
     parser.add_argument('model_output_name', type=str, help='Output name for the trained model.')
-    parser.add_argument('period_length', type=int, help='Length of a single period in the signals.')
+    parser.add_argument('period_length', type=int, nargs='?', default=None,
+                        help='Length of a single period in the signals (default: estimated from the data).')
+    parser.add_argument('--hop', type=int, default=None,
+                        help='Samples between the starts of consecutive training periods (default: period_length).')
+    parser.add_argument('--report-dir', type=str, default=None,
+                        help='Write the figures as PNG files to this directory instead of showing them.')
+    parser.add_argument('--no-plots', action='store_true', help='Skip all figures.')
+    parser.add_argument('--features', choices=FEATURE_SETS, default='raw',
+                        help='raw: each period and its derivatives; spectral: compact band power, harmonic and '
+                             'statistical descriptors (default: raw).')
+    parser.add_argument('--segmentation', choices=SEGMENTATIONS, default='fixed',
+                        help='fixed: windows of period_length samples; zero_crossing: each cycle between rising '
+                             'zero crossings, resampled to period_length samples (default: fixed).')
     args = parser.parse_args()
 
-    main(args.directory, args.model_output_name, args.period_length)
+    main(args.directory, args.model_output_name, args.period_length, args.hop, args.report_dir, not args.no_plots,
+         args.features, args.segmentation)